@@ -0,0 +1,222 @@
+"""
+Accumulators for aggregate functions
+
+Every aggregate is a class with the same life cycle: it is created
+empty, update()d with an iterable of column values (one call per group
+per chunk, so the loop over the values runs in C where possible),
+merge()d with the partial results that other workers computed for the
+same group, and finally asked for its result().
+"""
+
+import sketch
+
+_min = min
+_max = max
+
+class Aggregate(object):
+    """
+    Base of the accumulators; each one defines update(values),
+    merge(other) and result()
+    """
+    # numeric aggregates get string columns converted with int() first
+    numeric = False
+
+class Count(Aggregate):
+    def __init__(self):
+        self.n = 0
+
+    def update(self, values):
+        self.n += len(values)
+
+    def merge(self, other):
+        self.n += other.n
+
+    def result(self):
+        return self.n
+
+class Avg(Aggregate):
+    numeric = True
+
+    def __init__(self):
+        self.total = 0
+        self.n = 0
+
+    def update(self, values):
+        self.total += sum(values)
+        self.n += len(values)
+
+    def merge(self, other):
+        self.total += other.total
+        self.n += other.n
+
+    def result(self):
+        if not self.n:
+            return None
+        return float(self.total)/self.n
+
+class Min(Aggregate):
+    pick = staticmethod(_min)
+
+    def __init__(self):
+        self.value = None
+
+    def update(self, values):
+        if len(values):
+            self.merge_value(self.pick(values))
+
+    def merge_value(self, v):
+        if self.value is None:
+            self.value = v
+        else:
+            self.value = self.pick(self.value, v)
+
+    def merge(self, other):
+        if other.value is not None:
+            self.merge_value(other.value)
+
+    def result(self):
+        return self.value
+
+class Max(Min):
+    pick = staticmethod(_max)
+
+class Mode(Aggregate):
+    """
+    the `ind`th most common value (0 is the most common), from a
+    heavy hitter sketch unless `exact` is given, as in mode(col, 0, 'exact');
+    a value the sketch isn't sure of is shown with a ~ in front
+    """
+    def __init__(self, ind=0, exact=None):
+        if exact not in (None, 'exact'):
+            raise SyntaxError("mode's third argument can only be 'exact'")
+        self.ind = int(ind)
+        self.counts = sketch.SpaceSaving(None if exact else _max(100, 10*(self.ind+1)))
+
+    def update(self, values):
+        self.counts.update(values)
+
+    def merge(self, other):
+        self.counts.merge(other.counts)
+
+    def result(self):
+        common = self.counts.most_common(self.ind+1)
+        if len(common) <= self.ind:
+            return None
+        value, count = common[self.ind]
+        if not self.counts.certain(count):
+            return '~%s' % value
+        return value
+
+class Top(Aggregate):
+    """
+    the `k` most common values with their counts; a count the sketch
+    isn't sure puts its value among them has a ~ in front
+    """
+    def __init__(self, k=10):
+        self.k = int(k)
+        self.counts = sketch.SpaceSaving(_max(100, 10*self.k))
+
+    def update(self, values):
+        self.counts.update(values)
+
+    def merge(self, other):
+        self.counts.merge(other.counts)
+
+    def result(self):
+        return ', '.join('%s:%s%d' % (value, '' if self.counts.certain(count) else '~', count)
+            for value, count in self.counts.most_common(self.k))
+
+class CountDistinct(Aggregate):
+    """ approximate number of distinct values, from a HyperLogLog sketch """
+    def __init__(self):
+        self.sketch = sketch.HyperLogLog()
+
+    def update(self, values):
+        self.sketch.update(values)
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+
+    def result(self):
+        return len(self.sketch)
+
+class Median(Aggregate):
+    """ exact median; keeps every value, but selects rather than sorts """
+    numeric = True
+
+    def __init__(self):
+        self.values = []
+
+    def update(self, values):
+        self.values.extend(values)
+
+    def merge(self, other):
+        self.values.extend(other.values)
+
+    def result(self):
+        n = len(self.values)
+        if not n:
+            return None
+        if n & 0x01:
+            return sketch.select(self.values, n/2)
+        return (sketch.select(self.values, n/2-1) + sketch.select(self.values, n/2))/2.0
+
+class Percentile(Aggregate):
+    """ approximate `p`th percentile, from a KLL sketch of bounded size """
+    numeric = True
+
+    def __init__(self, p=50):
+        self.p = float(p)
+        if not 0 <= self.p <= 100:
+            raise SyntaxError("percentile must be between 0 and 100")
+        self.sketch = sketch.KLL()
+
+    def update(self, values):
+        self.sketch.update(values)
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+
+    def result(self):
+        return self.sketch.quantile(self.p/100)
+
+class P95(Percentile):
+    def __init__(self):
+        Percentile.__init__(self, 95)
+
+class P99(Percentile):
+    def __init__(self):
+        Percentile.__init__(self, 99)
+
+AGGREGATES = {
+    'count': Count,
+    'avg': Avg,
+    'mean': Avg,
+    'min': Min,
+    'max': Max,
+    'mode': Mode,
+    'top': Top,
+    'count_distinct': CountDistinct,
+    'median': Median,
+    'percentile': Percentile,
+    'p95': P95,
+    'p99': P99,
+}
+
+def merge(partials):
+    """
+    Merge a list of {key: [first_row, accumulators]} dicts, as returned
+    by the workers for their chunks, into one. For every group the
+    lowest row number seen is kept as the group's representative row.
+    """
+    groups = {}
+    for partial in partials:
+        for key, (first, accs) in partial.iteritems():
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [first, accs]
+                continue
+            group[0] = _min(group[0], first)
+            for acc, other in zip(group[1], accs):
+                acc.merge(other)
+    return groups
@@ -0,0 +1,160 @@
+"""
+On-disk cache of parsed logs
+
+Each log file gets one cache file holding its ColumnStore: the raw
+bytes of every column's array, the dictionary of each string column,
+and a trailer describing where everything is. The cache file name is
+derived from the log's path and the log format, and the trailer
+records the log's size, mtime and inode, so an entry is only used
+while the log is unchanged; a rotated or appended-to log is parsed
+again and its entry replaced. Entries are read through mmap(), so
+loading one costs little more than copying the arrays.
+
+The zone maps of the integer columns are cached too. Given the ranges
+a query's WHERE clause keeps some of those columns within, load() only
+copies the blocks of rows that can hold a match, so a query about a
+few minutes of a week of logs only touches those minutes of the file.
+"""
+
+import os
+import mmap
+import struct
+import marshal
+import hashlib
+import tempfile
+from array import array
+
+import store
+
+DIRECTORY = os.path.expanduser('~/.cache/logrok')
+VERSION = 3
+MAGIC = 'LOGROK-COLUMNS\n'
+TRAILER = struct.Struct('<Q')
+
+def cachable(logfile):
+    """ only regular files have a size, mtime and inode worth keying on """
+    return os.path.isfile(logfile.name)
+
+def _entry(path, fmt, directory):
+    key = hashlib.sha1('%s\0%s' % (os.path.abspath(path), fmt)).hexdigest()
+    return os.path.join(directory, key + '.columns')
+
+def identity(path, fmt):
+    """ what a cache entry for the log at `path` is only good for """
+    st = os.stat(path)
+    return {
+        'path': os.path.abspath(path),
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+        'inode': st.st_ino,
+        'format': fmt,
+        'version': VERSION,
+        'itemsizes': (array('l').itemsize, array('i').itemsize),
+    }
+
+def load(path, fmt, schema, directory=None, bounds=None):
+    """
+    The ColumnStore cached for the log at `path` parsed with `fmt`
+    into `schema`, or None if there isn't an up to date one. With
+    `bounds`, {column: (lo, hi)} as from where.bounds(), only the
+    blocks of rows whose zone maps overlap every range are loaded.
+    """
+    entry = _entry(path, fmt, directory or DIRECTORY)
+    try:
+        f = open(entry, 'rb')
+    except IOError:
+        return None
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (mmap.error, ValueError):
+        f.close()
+        return None
+    try:
+        if mm[:len(MAGIC)] != MAGIC or len(mm) < len(MAGIC) + TRAILER.size:
+            return None
+        start, = TRAILER.unpack(mm[-TRAILER.size:])
+        try:
+            meta = marshal.loads(mm[start:-TRAILER.size])
+        except (ValueError, EOFError, TypeError):
+            return None
+        current = identity(path, fmt)
+        if any(meta.get(k) != v for k, v in current.iteritems()):
+            return None
+        if [name for name, converter in schema] != [name for name, kind, sections in meta['columns']]:
+            return None
+        data = store.ColumnStore(schema)
+        zones = {}
+        for name, kind, sections in meta['columns']:
+            if kind == 'int':
+                offset, nbytes = sections[1]
+                zones[name] = store.ZoneMap()
+                zones[name].__setstate__(marshal.loads(mm[offset:offset+nbytes]))
+        ranges = [(0, meta['length'])]
+        for name, (lo, hi) in (bounds or {}).iteritems():
+            if name in zones:
+                ranges = store.intersect(ranges, zones[name].ranges(lo, hi))
+        ranges = store.coalesce(ranges)
+        for name, kind, sections in meta['columns']:
+            col = data.columns[name]
+            offset, nbytes = sections[0]
+            if kind == 'dict':
+                _read(col.codes, mm, offset, ranges)
+                offset, nbytes = sections[1]
+                col.values = marshal.loads(mm[offset:offset+nbytes])
+                col.reindex()
+            else:
+                _read(col.values, mm, offset, ranges)
+                if ranges == [(0, meta['length'])]:
+                    col.zones = zones[name]
+        data.length = sum(stop - start for start, stop in ranges)
+        data.skipped = meta.get('skipped', 0)
+        return data
+    finally:
+        mm.close()
+        f.close()
+
+def _read(values, mm, offset, ranges):
+    """ append the `ranges` of rows of the array stored at `offset` to `values` """
+    size = values.itemsize
+    for start, stop in ranges:
+        values.fromstring(buffer(mm, offset + start*size, (stop-start)*size))
+
+def save(path, fmt, data, before, directory=None):
+    """
+    Cache `data`, the ColumnStore parsed from the log at `path` with
+    `fmt`. `before` is the log's identity() from before it was parsed:
+    lines appended while it was being parsed may not be in `data`, so
+    the entry must not claim the size the log has now. The entry is
+    written to a temporary file and renamed into place, so a reader
+    never sees half of one.
+    """
+    directory = directory or DIRECTORY
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    meta = dict(before)
+    meta['length'] = len(data)
+    meta['skipped'] = data.skipped
+    meta['columns'] = []
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            def section(s):
+                offset = f.tell()
+                f.write(s)
+                return (offset, len(s))
+            for name in data.fields:
+                col = data.columns[name]
+                if isinstance(col, store.DictColumn):
+                    sections = [section(col.codes.tostring()), section(marshal.dumps(col.values))]
+                    meta['columns'].append((name, 'dict', sections))
+                else:
+                    sections = [section(col.values.tostring()), section(marshal.dumps(col.zonemap().__getstate__()))]
+                    meta['columns'].append((name, 'int', sections))
+            start = f.tell()
+            f.write(marshal.dumps(meta))
+            f.write(TRAILER.pack(start))
+        os.rename(tmp, _entry(path, fmt, directory))
+    except:
+        os.unlink(tmp)
+        raise
@@ -0,0 +1,161 @@
+"""
+EXPLAIN and EXPLAIN ANALYZE
+
+explain() prints the operators a query will run, last one first, each
+indented under the operator that consumes its output. With analyze the
+query is run one operator at a time and every operator is shown with
+the rows it took and gave, its wall and CPU time, the workers it used,
+the bytes pickled across the worker queues, how much the main
+process's resident memory grew and the most any worker held.
+Operators that stream batches to the next one are measured while their
+output is being pulled, so their times include the operators below.
+"""
+
+import os
+import time
+import types
+
+import parallel
+import sqlfuncs
+
+class Stage(object):
+    """ one operator of a plan, and what it cost if it has been run """
+    def __init__(self, name, detail=''):
+        self.name = name
+        self.detail = detail
+        self.note = ''
+        self.analyzed = False
+        # whether to pickle what is queued for the workers to count its bytes
+        self.shipped = True
+        self.streamed = False
+        self.rows_in = self.rows_out = None
+        self.wall = self.cpu = 0.0
+        self.workers = set()
+        self.bytes_in = self.bytes_out = 0
+        self.rss_start = None
+        self.grew = None
+        self.worker_rss = None
+
+    def run(self, op, data):
+        """ run `op` on `data`, recording what it cost, and return its output """
+        self.rows_in = _rows(data)
+        counters = parallel.count(self.shipped)
+        self.rss_start = parallel.rss()
+        started, start_cpu = time.time(), _cpu()
+        try:
+            out = op(data)
+        finally:
+            parallel.uncount(counters)
+        self.record(time.time() - started, _cpu() - start_cpu, counters)
+        if self.rows_in is None:
+            # a stream of chunks: count what the workers consumed
+            self.rows_in = counters.rows
+        if isinstance(out, types.GeneratorType):
+            self.streamed = True
+            return self._metered(out)
+        self.rows_out = _rows(out)
+        return out
+
+    def _metered(self, batches):
+        """ pass `batches` on, adding what it cost to produce each one """
+        self.rows_out = 0
+        while True:
+            counters = parallel.count(self.shipped)
+            started, start_cpu = time.time(), _cpu()
+            try:
+                batch = next(batches)
+            except StopIteration:
+                return
+            finally:
+                parallel.uncount(counters)
+                self.record(time.time() - started, _cpu() - start_cpu, counters)
+            self.rows_out += len(batch)
+            yield batch
+
+    def record(self, wall, cpu, counters):
+        self.analyzed = True
+        self.wall += wall
+        # the main process's time plus whatever the workers spent
+        self.cpu += cpu + counters.cpu
+        self.workers.update(counters.workers)
+        self.bytes_in += counters.bytes_in
+        self.bytes_out += counters.bytes_out
+        rss = parallel.rss()
+        if self.rss_start is not None and rss is not None:
+            self.grew = rss - self.rss_start
+        self.worker_rss = max(self.worker_rss, counters.rss)
+
+    def describe(self):
+        line = self.name
+        if self.detail:
+            line += ' ' + self.detail.replace('__line__', '*')
+        if self.note:
+            line += ' (%s)' % self.note
+        return line
+
+    def stats(self):
+        return "rows in %s out %s, wall %s, cpu %s, %d workers, shipped %s in %s out, rss %s, worker rss %s" % (
+            _count(self.rows_in), _count(self.rows_out), _seconds(self.wall), _seconds(self.cpu),
+            len(self.workers), self._shipped(self.bytes_in), self._shipped(self.bytes_out), _growth(self.grew),
+            _size(self.worker_rss))
+
+    def _shipped(self, n):
+        return _bytes(n) if self.shipped else '?'
+
+def stages(stmt, data, parse=None):
+    """
+    (Stage, op) pairs for running `stmt` on `data`, starting with
+    `parse`, the Stage that loaded the logs, if there is one
+    """
+    plan = [(Stage(name, detail), op) for name, detail, op in sqlfuncs.operators(stmt, data)]
+    if parse is not None:
+        plan.insert(0, (parse, None))
+    return plan
+
+def explain(stmt, data, parse=None, analyze=False):
+    plan = stages(stmt, data, parse)
+    if analyze:
+        for stage, op in plan:
+            if op is not None:
+                data = stage.run(op, data)
+        for (before, op), (stage, op) in zip(plan, plan[1:]):
+            if before.streamed:
+                stage.rows_in = before.rows_out
+    for depth, (stage, op) in enumerate(reversed(plan)):
+        indent = '   ' * depth
+        print "%s-> %s" % (indent, stage.describe())
+        if analyze and stage.analyzed:
+            print "%s     %s" % (indent, stage.stats())
+
+def _rows(data):
+    try:
+        return len(data)
+    except TypeError:
+        return None
+
+def _cpu():
+    t = os.times()
+    return t[0] + t[1]
+
+def _count(n):
+    return '?' if n is None else str(n)
+
+def _seconds(s):
+    if s < 1:
+        return "%0.1fms" % (s * 1000)
+    return "%0.3fs" % s
+
+def _size(n):
+    return '?' if n is None else _bytes(n)
+
+def _growth(n):
+    if n is None:
+        return '?'
+    return ('-' if n < 0 else '+') + _bytes(abs(n))
+
+def _bytes(n):
+    for unit in ('B', 'KB', 'MB'):
+        if n < 1024:
+            return "%d%s" % (n, unit)
+        n /= 1024
+    return "%dGB" % n
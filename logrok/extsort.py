@@ -0,0 +1,113 @@
+"""
+External merge sort for ORDER BY
+
+Workers sort their chunk of the data into a run of (key, row number)
+entries. While the whole sort fits in the memory budget the runs come
+back to the main process as lists; otherwise each worker spills its run
+to a temporary file. Either way the runs are merged lazily, so only one
+entry per run is ever waiting to be compared.
+"""
+
+import os
+import heapq
+import marshal
+import tempfile
+from multiprocessing import cpu_count
+
+# bytes of memory the sort may use (-S)
+BUDGET = 256 * 1024 * 1024
+
+# rough size of one (key tuple, row number) entry in a python list
+ENTRY_BYTES = 200
+
+# entries per block in a spill file, and the shortest run worth making
+BLOCK = 10000
+
+# most runs merged at once; more than this are merged in several passes
+FANIN = 64
+
+def must_spill(rows, budget=None):
+    """ True if sorting `rows` rows would not fit in `budget` bytes """
+    if budget is None:
+        budget = BUDGET
+    return rows * ENTRY_BYTES > budget
+
+def run_length(rows, numprocs, budget=None):
+    """
+    Rows per run: each worker sorts an equal share, but no more than
+    fits in its part of the budget while all of them are sorting
+    """
+    if budget is None:
+        budget = BUDGET
+    if numprocs < 1:
+        numprocs = cpu_count()
+    share = -(-rows // numprocs)
+    return max(1, min(share, max(BLOCK, budget / ENTRY_BYTES / numprocs)))
+
+def spill(run):
+    """ write the sorted entries of `run` to a temporary file and return its path """
+    fd, path = tempfile.mkstemp(prefix='logrok-sort-')
+    with os.fdopen(fd, 'wb') as f:
+        block = []
+        for entry in run:
+            block.append(entry)
+            if len(block) == BLOCK:
+                marshal.dump(block, f)
+                block = []
+        if block:
+            marshal.dump(block, f)
+    return path
+
+def read_run(path):
+    """ the entries of a spilled run, a block at a time; the file is removed when done """
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    block = marshal.load(f)
+                except EOFError:
+                    return
+                for entry in block:
+                    yield entry
+    finally:
+        os.unlink(path)
+
+class _Descending(object):
+    """ an entry that sorts the other way round, for merging descending runs """
+    __slots__ = ('entry',)
+
+    def __init__(self, entry):
+        self.entry = entry
+
+    def __lt__(self, other):
+        return other.entry < self.entry
+
+def merge(runs, reverse=False):
+    """
+    Lazily merge sorted `runs`, each a list or the path of a spilled
+    run. With `reverse` the runs are sorted largest first.
+    """
+    runs = list(runs)
+    while len(runs) > FANIN:
+        # too many to have open at once: merge them into fewer, longer runs
+        runs = [spill(merge(runs[i:i+FANIN], reverse)) for i in xrange(0, len(runs), FANIN)]
+    iters = [read_run(r) if isinstance(r, basestring) else iter(r) for r in runs]
+    if not reverse:
+        return heapq.merge(*iters)
+    return _merge_descending(iters)
+
+def _merge_descending(iters):
+    heap = []
+    for i, it in enumerate(iters):
+        for entry in it:
+            heap.append((_Descending(entry), i, it))
+            break
+    heapq.heapify(heap)
+    while heap:
+        top, i, it = heap[0]
+        yield top.entry
+        for entry in it:
+            heapq.heapreplace(heap, (_Descending(entry), i, it))
+            break
+        else:
+            heapq.heappop(heap)
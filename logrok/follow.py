@@ -0,0 +1,61 @@
+"""Follow growing log files, like tail -F"""
+
+import io
+import os
+
+class Tail(object):
+    """
+    Reads the lines appended to the log at `path` since the last read.
+    The file is followed by name: if `path` is replaced by a new file
+    (rotation, noticed by its inode changing) the rest of the old file
+    is read first and the new one from its start, and if it shrinks
+    (truncated in place, as copytruncate does) it is read from the
+    start again. A line is only returned once its newline is there,
+    except for the last line of a rotated file, which can't grow any more.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._open()
+
+    def _open(self):
+        self.file = io.FileIO(self.path, 'rb')
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        self.partial = ''
+
+    def chunks(self, blocksize):
+        """ yield lists of the complete lines appended since the last call """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            # rotated away and not created again yet
+            st = None
+        if st is not None and st.st_ino != self.inode:
+            for chunk in self._read(blocksize):
+                yield chunk
+            if self.partial:
+                yield [self.partial]
+            self.file.close()
+            self._open()
+        elif st is not None and st.st_size < self.file.tell():
+            self.file.seek(0)
+            self.partial = ''
+        for chunk in self._read(blocksize):
+            yield chunk
+
+    def _read(self, blocksize):
+        # io.FileIO reads with read(2), so more data is found after EOF
+        while True:
+            block = self.file.read(blocksize)
+            if not block:
+                return
+            if self.partial:
+                block = self.partial + block
+            end = block.rfind('\n')
+            if end == -1:
+                self.partial = block
+                continue
+            self.partial = block[end+1:]
+            yield block[:end].split('\n')
+
+    def close(self):
+        self.file.close()
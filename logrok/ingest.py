@@ -0,0 +1,83 @@
+"""Read log files in bounded blocks and hand them to the parser as line chunks"""
+
+import os
+import mmap
+
+BLOCKSIZE = 1024 * 1024
+
+def read_blocks(logfile, blocksize=BLOCKSIZE):
+    """
+    Read `logfile` `blocksize` bytes at a time and yield lists of the
+    complete lines in each block. A partial line at the end of a block
+    is carried over to the next one, so no line is ever split.
+    """
+    remainder = ''
+    while True:
+        block = logfile.read(blocksize)
+        if not block:
+            break
+        if remainder:
+            block = remainder + block
+        end = block.rfind('\n')
+        if end == -1:
+            remainder = block
+            continue
+        remainder = block[end+1:]
+        yield block[:end].split('\n')
+    if remainder:
+        yield [remainder]
+
+def chunks(logfiles, blocksize=BLOCKSIZE, lines=None):
+    """
+    Yield line chunks from each file in `logfiles` in turn, stopping
+    after `lines` lines if it is given. Files are closed once read.
+    """
+    seen = 0
+    for logfile in logfiles:
+        try:
+            for chunk in read_blocks(logfile, blocksize):
+                if lines is not None and seen + len(chunk) >= lines:
+                    yield chunk[:lines-seen]
+                    return
+                seen += len(chunk)
+                yield chunk
+        finally:
+            logfile.close()
+
+def mappable(logfile):
+    """ True if `logfile` is a regular, non-empty file that can be mmap()ed """
+    return os.path.isfile(logfile.name) and os.path.getsize(logfile.name) > 0
+
+def ranges(logfiles, blocksize=BLOCKSIZE):
+    """
+    Yield (path, start, end) byte ranges of roughly `blocksize` bytes
+    covering each file in `logfiles`. Every range ends just after a
+    newline (or at EOF), so a worker can parse its range on its own.
+    Only the pages around each boundary are ever touched here.
+    """
+    for logfile in logfiles:
+        path = os.path.abspath(logfile.name)
+        mm = mmap.mmap(logfile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            size = len(mm)
+            start = 0
+            while start < size:
+                end = mm.find('\n', min(start + blocksize, size) - 1)
+                end = size if end == -1 else end + 1
+                yield (path, start, end)
+                start = end
+        finally:
+            mm.close()
+            logfile.close()
+
+_maps = {}
+def read_range(path, start, end):
+    """ Return the lines in bytes [start, end) of `path`, mmap()ing it once per process """
+    mm = _maps.get(path)
+    if mm is None:
+        with open(path, 'rb') as f:
+            mm = _maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data = mm[start:end]
+    if data.endswith('\n'):
+        data = data[:-1]
+    return data.split('\n')
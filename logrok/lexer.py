@@ -47,7 +47,7 @@ def t_STAR(t):
     return t
 
 def t_OPERATOR(t):
-    r'=|<>|<|>|<=|>='
+    r'<>|<=|>=|=|<|>'
     op = t.value
     if op == '=':
         t.value = ast.Eq()
@@ -66,7 +66,7 @@ def t_OPERATOR(t):
 
 def t_INTEGER(t):
     r'\d+'
-    t.value = ast.Num(t.value)
+    t.value = ast.Num(int(t.value))
     return t
 
 def t_IDENTIFIER(t):
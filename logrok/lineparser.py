@@ -0,0 +1,77 @@
+"""
+Compile a log format into a parser for its lines
+
+A LineParser is made once per format. For the fields a query keeps it
+generates a function that turns a line into a tuple of converted
+values, like
+
+    def parse(line):
+        m = match(line)
+        ...
+        g = m.groups()
+        return (g[0], c1(g[3]), int(g[5]), ...)
+
+so the converters are looked up once, values are taken from m.groups()
+by position rather than by name, and strings aren't passed through
+str(). Lines that don't match the format are skipped.
+"""
+
+import re
+
+from util import parse_format_string
+import logformat
+
+class LineParser(object):
+    def __init__(self, fmt):
+        self.format = fmt
+        self.regex = re.compile(parse_format_string(fmt))
+        self.groups = sorted(self.regex.groupindex, key=self.regex.groupindex.get)
+        self.fields = []
+        for group in self.groups:
+            self.fields.append(group)
+            # and the fields converted from it, like date_time_epoch
+            self.fields.extend(f for f, source in sorted(logformat.sources.iteritems()) if source == group)
+        self.schema = [(f, logformat.types.get(f, str)) for f in self.fields]
+        self._compiled = {}
+
+    def compile(self, schema=None):
+        """
+        A function of a line that returns a tuple of the fields in
+        `schema` (all of them by default), or None if the line isn't
+        in this format. Compiled once per schema per process.
+        """
+        if schema is None:
+            schema = self.schema
+        key = tuple(f for f, converter in schema)
+        parse = self._compiled.get(key)
+        if parse is None:
+            parse = self._compiled[key] = self._compile(schema)
+        return parse
+
+    def _compile(self, schema):
+        namespace = {'match': self.regex.match}
+        values = []
+        for f, converter in schema:
+            group = logformat.sources.get(f, f)
+            item = 'g[%d]' % (self.regex.groupindex[group] - 1)
+            if converter is int:
+                item = 'int(%s)' % item
+            elif converter is not str:
+                name = 'c%d' % len(namespace)
+                namespace[name] = converter
+                item = '%s(%s)' % (name, item)
+            values.append(item)
+        source = [
+            "def parse(line):",
+            "    m = match(line)",
+            "    if m is None:",
+            "        return None",
+            "    g = m.groups()",
+            "    try:",
+            "        return (%s,)" % ', '.join(values),
+            "    except (ValueError, IndexError, KeyError):",
+            "        return None",
+        ]
+        self.source = '\n'.join(source)
+        exec compile(self.source, '<log format %r>' % self.format, 'exec') in namespace
+        return namespace['parse']
@@ -1,7 +1,7 @@
 import re
-from functools import partial, wraps
 
 import util
+import timestamps
 
 TYPES = {
     'apache-common': "%h %l %u %t \"%r\" %>s %b",
@@ -14,10 +14,23 @@ TYPES = {
 
 types = {}
 
+# fields that are not groups of the log regex, but are converted from
+# the text of one: {field: group}
+sources = {}
+
 def settype(name, f):
     global types
     types[name] = f
 
+def settime(name, ts):
+    """
+    `name` holds times in the format of `ts`, a timestamps.Timestamp;
+    it is stored as YYYYMMDDhhmmss and `name`_epoch as epoch seconds
+    """
+    settype(name, ts.sortable)
+    settype(name + '_epoch', ts.epoch)
+    sources[name + '_epoch'] = name
+
 class Regex(object):
     @staticmethod
     def r(rx, name, nocapture):
@@ -37,6 +50,12 @@ class Regex(object):
         settype(name, int)
         return Regex.r(r'\d+', name, nocapture)
 
+    @staticmethod
+    def clfnumber(name='', nocapture=False):
+        """ a number, or '-' for zero as in apache's %b """
+        settype(name, util.clf_number)
+        return Regex.r(r'(?:\d+|-)', name, nocapture)
+
     @staticmethod
     def string(name='', nocapture=False):
         settype(name, str)
@@ -45,12 +64,20 @@ class Regex(object):
     @staticmethod
     def commontime(name='', nocapture=False):
         if name is not '':
-            settype(name, util.common_strptime)
+            settime(name, timestamps.compile(timestamps.COMMON))
             name = r'?P<%s>' % name
         if nocapture:
             return r'\[[^\]]+]'
         return r'\[(%s[^\]]+)]' % name
 
+    @staticmethod
+    def strftime(fmt, name='', nocapture=False):
+        """ a time in the strftime format `fmt`, from %{format}t """
+        ts = timestamps.compile(fmt)
+        if name is not '':
+            settime(name, ts)
+        return Regex.r(ts.regex, name, nocapture)
+
     @staticmethod
     def nil(name='', nocapture=False):
         settype(name, str)
@@ -61,22 +88,19 @@ class Regex(object):
         settype(name, str)
         return Regex.r(r'X|\+|\-', name, nocapture)
 
+    @staticmethod
     def any(name='', nocapture=False):
         settype(name, str)
         return Regex.r(r'.*', name, nocapture)
 
-    @staticmethod
-    def _or(a, b, name=''):
-        if name is not '':
-            name = r'?P<%s>' % name
-        return "("+name+a(nocapture=True)+"|"+b(nocapture=True)+")"
-
     @staticmethod
     def dstring(start, negmatch, end, name='', nocapture=False):
         """ grab all not-negmatch chars, but allow for backslash-escaped negmatch """
         if name is not '':
             settype(name, str)
             name = r'?P<%s>' % name
+        # the quotes may be regex syntax, as the brackets of %v[%P] are
+        start, negmatch, end = re.escape(start), re.escape(negmatch), re.escape(end)
         if nocapture:
             return r'%s[^%s\\]*(?:\\.[^%s\\]*)*%s' % (start, negmatch, negmatch, end)
         return r'%s(%s[^%s\\]*(?:\\.[^%s\\]*)*)%s' % (start, name, negmatch, negmatch, end)
@@ -85,7 +109,7 @@ FORMAT = {
     'a': (Regex.host, "remote_ip"),
     'A': (Regex.host, "local_ip"),
     'B': (Regex.number, "body_size"),
-    'b': (partial(Regex._or, Regex.number, Regex.nil), "body_size"),
+    'b': (Regex.clfnumber, "body_size"),
     'C': (Regex.string, "cookie"),
     'D': (Regex.number, "response_time_us"),
     'e': (Regex.string, "environment_var"),
@@ -11,37 +11,41 @@ import readline
 import atexit
 import time
 import inspect
+from itertools import imap
 from multiprocessing import cpu_count
-try:
-    from collections import OrderedDict
-except ImportError:
-    # python < 2.7 compatability
-    from compat.OrderedDict import OrderedDict
 
 from ply import yacc
 
 import parser
 import parallel
+import ingest
+import cache
+import follow
 import screen
 import sqlfuncs
+import planner
+import where
+import explain
+import extsort
 import logformat
-from util import NoTokenError, parse_format_string, Complete, Table, pretty_print
+import lineparser
+import store
+from util import NoTokenError, Complete, Table, pretty_print
 
 DEBUG = False
-log_regex = None
+log_parser = None
+log_fields = None
+log_schema = None
 
 class LogQuery(object):
-    def __init__(self, data, query):
+    def __init__(self, data, query, statement=None):
         self.data = data
         self.query = query
-        try:
-            self.ast = parser.parse(query)
-        except NoTokenError, e:
-            print "ERROR: %s" % e.message
-            print query
-            return
-        except SyntaxError:
-            return
+        if statement is not None:
+            # already parsed (and planned) before the logs were crunched
+            self.ast = statement
+        else:
+            self.ast = parse(query)
         if DEBUG:
             # pretty-printer
             sq = str(self.ast)
@@ -52,14 +56,13 @@ class LogQuery(object):
     
     def run(self):
         start_time = time.time()
-        op_data = sqlfuncs.do(self.ast, self.data[:]) # COPY!!! 
-        response = OrderedDict()
-        for row in op_data:
-            for key in row.keys():
-                if not response.has_key(key):
-                    response[key] = []
-                response[key].append(row[key])
-        Table(response, start_time).prnt()
+        # no copy: nothing in sqlfuncs.do() modifies its input, and the
+        # worker pool only recognises the session dataset by identity
+        # the rows go to the table as they are, with no pivot into columns
+        Table(sqlfuncs.do(self.ast, self.data), start_time).prnt()
+
+    def explain(self, parse=None, analyze=False):
+        explain.explain(self.ast, self.data, parse, analyze)
 
 class LoGrok(object):
     def __init__(self, args, interactive=False, curses=False, chunksize=10000):
@@ -71,38 +74,167 @@ class LoGrok(object):
         self.args = args
         self.processed_rows = 0
         self.oldpct = 0
-        self.data = []
+        self.data = None
+        self.plan = None
+        self.parse = None
         self.chunksize = chunksize
         self.complete = Complete()
         self.crunchlogs()
+        if not self.args.follow:
+            # the pool's workers only ever see the rows loaded so far
+            parallel.start_pool(self.data, self.args.processes)
         self.interact()
 
     def crunchlogs(self):
-        global log_regex
+        global log_parser, log_fields, log_schema
         if self.args.format is not None:
-            logformat = self.args.format
+            fmt = self.args.format
         else:
-            logformat = logformat.TYPES[self.args.type]
+            fmt = logformat.TYPES[self.args.type]
 
         print
-        lines = []
-        for logfile in self.args.logfile:
-            screen.print_mutable("Reading lines from %s:" % logfile.name)
-            lines += logfile.readlines()
-            screen.print_mutable("Reading lines from %s: %d" % (logfile.name, len(lines)))
-            logfile.close()
-            screen.print_mutable("", True)
-
-        log_regex = re.compile(parse_format_string(logformat))
-        if self.args.lines:
-            lines = lines[:self.args.lines]
+        log_parser = lineparser.LineParser(fmt)
+        log_fields = log_parser.fields
+        log_schema = log_parser.schema
+        cached = self.args.cache and not (self.args.lines or self.args.follow)
+        if self.args.query and not (self.interactive or screen.is_curses()):
+            try:
+                # logs are cached whole, so nothing can be pushed into the parser
+                self.plan = plan_query(self.args.query, pushdown=not cached)
+            except SyntaxError, e:
+                # nothing else will be run, so don't bother reading the logs
+                if e.message:
+                    print "ERROR: %s" % e.message
+                sys.exit(1)
+        schema = log_schema
+        predicate = None
+        if self.plan is not None:
+            schema, predicate = self.plan.schema, self.plan.predicate
+        self.schema, self.predicate = schema, predicate
+        self.data = store.ColumnStore(schema)
+        detail = ', '.join(f for f, converter in schema)
+        if predicate is not None:
+            detail += ' where %s' % where.describe(self.plan.where)
+        self.parse = explain.Stage('parse', detail)
+        self.parse.note = 'when the logs were loaded'
+        # counting the bytes means pickling every chunk twice, so only
+        # do it if the query is going to report them
+        query = (self.args.query or '').lower()
+        self.parse.shipped = query.startswith(EXPLAIN) and query[len(EXPLAIN):].strip().startswith(ANALYZE)
+        bounds = None
+        if cached and self.plan is not None and self.plan.statement.where is not None:
+            numeric = set(f for f, converter in schema if converter is not str)
+            bounds = where.bounds(self.plan.statement.where, numeric)
+            if bounds:
+                self.parse.detail += '; cached blocks by the zone maps of %s' % ', '.join(sorted(bounds))
         st = time.time()
-        self.data = parallel.run(log_match, lines, _print=True)
+        if self.args.follow:
+            self.tails = []
+            for logfile in self.args.logfile:
+                self.tails.append(follow.Tail(logfile.name))
+                logfile.close()
+            self.parse.run(lambda chunks: self.crunch_chunks(chunks, schema, predicate), self.appended(self.tails))
+        elif cached:
+            # an iterator, so the Stage counts the lines the workers parsed
+            loaded = self.parse.run(lambda logfiles: self.cached(logfiles, fmt, bounds), iter(self.args.logfile))
+            self.parse.rows_in += loaded
+        else:
+            self.parse.run(lambda chunks: self.crunch_chunks(chunks, schema, predicate), self.chunks(self.args.logfile))
         et = time.time()
-        print "%d lines crunched in %0.3f seconds" % (len(lines), (et-st))
+        self.parse.rows_out = len(self.data)
+        skipped = ''
+        if self.data.skipped:
+            skipped = " (%d lines skipped, not in the log format)" % self.data.skipped
+        if predicate is not None:
+            print "%d matching lines crunched in %0.3f seconds%s" % (len(self.data), (et-st), skipped)
+        elif bounds:
+            print "%d lines from blocks that may match crunched in %0.3f seconds%s" % (len(self.data), (et-st), skipped)
+        else:
+            print "%d lines crunched in %0.3f seconds%s" % (len(self.data), (et-st), skipped)
+
+    def crunch(self, logfiles, schema=None, predicate=None, data=None):
+        """ parse `logfiles` into `data` (the session's store by default) """
+        self.crunch_chunks(self.chunks(logfiles), schema, predicate, data)
+
+    def chunks(self, logfiles):
+        """ the chunks of `logfiles` to hand to log_match """
+        if self.args.mmap and not self.args.lines and all(ingest.mappable(f) for f in logfiles):
+            return ingest.ranges(logfiles, self.args.blocksize)
+        return ingest.chunks(logfiles, self.args.blocksize, self.args.lines)
+
+    def crunch_chunks(self, chunks, schema=None, predicate=None, data=None, _print=True):
+        if data is None:
+            data = self.data
+        parallel.stream(log_match, chunks, window=self.args.window, _print=_print, collect=data.merge,
+            schema=schema, predicate=predicate)
+
+    def appended(self, tails):
+        """ chunks of the lines added to each followed log since it was last read """
+        for tail in tails:
+            for chunk in tail.chunks(self.args.blocksize):
+                yield chunk
+
+    def watch(self):
+        """
+        Show the result of the -q query, then keep reading what is added
+        to the logs and show the updated result every --refresh seconds
+        """
+        if self.plan is not None:
+            statement, self.plan = self.plan.statement, None
+        else:
+            statement = parse(self.args.query.split(';')[0])
+        standing = sqlfuncs.Standing(statement, self.data)
+        seen = None
+        while True:
+            if len(self.data) != seen:
+                seen = len(self.data)
+                start_time = time.time()
+                rows = standing.update()
+                if rows or seen == 0 or standing.whole:
+                    print "-- %s, %d rows" % (time.strftime('%H:%M:%S'), seen)
+                    Table(rows, start_time).prnt()
+            time.sleep(self.args.refresh)
+            self.crunch_chunks(self.appended(self.tails), self.schema, self.predicate, _print=False)
+
+    def cached(self, logfiles, fmt, bounds=None):
+        """
+        Load each of `logfiles` from the on-disk cache, parsing (and
+        caching) the ones that aren't there or have changed since.
+        `bounds` is passed on to cache.load(). Returns the number of
+        rows that were loaded from the cache.
+        """
+        loaded = 0
+        for logfile in logfiles:
+            if not cache.cachable(logfile):
+                self.crunch([logfile])
+                continue
+            data = cache.load(logfile.name, fmt, log_schema, self.args.cache_dir, bounds)
+            if data is not None:
+                logfile.close()
+                loaded += len(data)
+            else:
+                before = cache.identity(logfile.name, fmt)
+                data = store.ColumnStore(log_schema)
+                self.crunch([logfile], data=data)
+                try:
+                    cache.save(logfile.name, fmt, data, before, self.args.cache_dir)
+                except (IOError, OSError), e:
+                    print "WARNING: could not cache %s: %s" % (logfile.name, e)
+            self.data.merge(data)
+        return loaded
 
     def interact(self):
-        if screen.is_curses():
+        if self.args.follow:
+            try:
+                self.watch()
+            except KeyboardInterrupt:
+                print
+            except SyntaxError, e:
+                if e.message:
+                    print "ERROR: %s" % e.message
+            except parallel.WorkerError, e:
+                print "ERROR: %s" % e
+        elif screen.is_curses():
             screen.draw_curses_screen(self.data)
             self.main_loop()
         elif self.interactive:
@@ -123,8 +255,8 @@ class LoGrok(object):
         # XXX This is ugly and needs to be more intelligent. Ideally, the 
         #     completer would use readline.readline() to contextually switch out
         #     the returned matches
-        self.complete.addopts(['select', 'from log', 'where', 'between',
-            'order by', 'group by', 'limit', ] + get_sqlfuncs() + self.data[0].keys())
+        self.complete.addopts(['select', 'explain', 'analyze', 'from log', 'where', 'between',
+            'order by', 'group by', 'limit', ] + get_sqlfuncs() + self.data.fields)
         while True:
             q = raw_input("logrok> ").strip()
             while not q.endswith(";"):
@@ -135,24 +267,41 @@ class LoGrok(object):
         semicolon = query.find(';')
         if semicolon != -1:
             query = query[:semicolon]
-        if query in ('quit', 'bye', 'exit'):
+        if query in QUIT:
             sys.exit(0)
-        if query.startswith('help') or query.startswith('?'):
+        if query.startswith(HELP):
             answer = "Use sql syntax against your log, `from` clauses are ignored.\n"\
                      "Queries can span multiple lines and _must_ end in a semicolon `;`.\n"\
                      " Try: `show fields;` to see available field names. Press TAB at the\n"\
                      " beginning of a new line to see all available completions."
             print answer
             return 
-        if query in ('show fields', 'show headers'):
-            print ', '.join(self.data[0].keys())
+        if query in SHOW:
+            print ', '.join(self.data.fields)
             return
         else:
+            statement = None
+            if self.plan is not None:
+                # the one-shot query, planned by crunchlogs()
+                statement, self.plan = self.plan.statement, None
+            explaining = analyze = False
+            if query.lower().startswith(EXPLAIN):
+                explaining = True
+                query = query[len(EXPLAIN):].strip()
+                if query.lower().startswith(ANALYZE):
+                    analyze = True
+                    query = query[len(ANALYZE):].strip()
             try:
-                q = LogQuery(self.data, query)
+                q = LogQuery(self.data, query, statement)
+                if explaining:
+                    return q.explain(self.parse, analyze)
                 return q.run()
             except SyntaxError, e:
+                if e.message:
+                    print "ERROR: %s" % e.message
                 return e.message
+            except parallel.WorkerError, e:
+                print "ERROR: %s" % e
     
     def main_loop(self):
         while 1:
@@ -160,38 +309,61 @@ class LoGrok(object):
             if c == ord('x'): break
             if c == ord('q'): screen.prompt("QUERY:", self.query)
 
+QUIT = ('quit', 'bye', 'exit')
+HELP = ('help', '?')
+SHOW = ('show fields', 'show headers')
+EXPLAIN = 'explain'
+ANALYZE = 'analyze'
+
+def parse(query):
+    try:
+        return parser.parse(query)
+    except NoTokenError, e:
+        print "ERROR: %s" % e.message
+        print query
+        raise SyntaxError()
+
+def plan_query(query, pushdown=True):
+    """
+    Plan a query that will be the only one run on this data, so that
+    its WHERE clause and projection can be pushed down into log_match.
+    Returns None for commands that aren't queries.
+    """
+    query = query.split(';')[0]
+    if query in QUIT or query in SHOW or query.startswith(HELP) or query.lower().startswith(EXPLAIN):
+        return None
+    return planner.plan(parse(query), log_schema, pushdown=pushdown)
+
 def get_sqlfuncs():
     return map(
         lambda x: x[0],
         filter(
-            lambda x: not x[0].startswith('_') and not x[0] == 'do',
+            lambda x: not x[0].startswith('_') and not x[0] in ('do', 'operators'),
             inspect.getmembers(sqlfuncs, inspect.isfunction)
         )
     )
 
 @parallel.map
-def log_match(chunk):
-    response = []
-    for line in chunk:
-        out = {}
-        m = log_regex.match(line)
-        for key in log_regex.groupindex:
-            if logformat.types.has_key(key):
-                f = logformat.types[key]
-            else:
-                f = str
-            """
-            # XXX
-            # This is a hack a big big hack
-            #  It's here because I discovered that converting the date
-            #  strings into date objects using strptime is a HUGE performance hit!
-            # -- don't know what to do about that
-            if f not in (int, str):
-                f = str
-            """
-            d = m.group(key)
-            out[key] = f(d)
-        response.append(out)
+def log_match(chunk, schema=None, predicate=None):
+    """
+    parse lines into a ColumnStore of their own; its string columns are
+    dictionary-encoded here so each distinct value is pickled once per chunk.
+    Only the fields in `schema` are kept, and only lines that pass
+    `predicate` (a compiled where clause) if there is one. Lines that
+    aren't in the log format, or whose fields don't convert, are
+    skipped and counted.
+    """
+    if isinstance(chunk, tuple):
+        # (path, start, end) from ingest.ranges()
+        chunk = ingest.read_range(*chunk)
+    if schema is None:
+        schema = log_schema
+    response = store.ColumnStore(schema)
+    rows = filter(None, imap(log_parser.compile(schema), chunk))
+    response.skipped = len(chunk) - len(rows)
+    if predicate is not None:
+        rows = predicate.filter(rows)
+    response.extend(rows)
     return response
 
 def main():
@@ -203,6 +375,14 @@ def main():
     cmd.add_argument('-T', '--ctype',  help='type-name for LogFormat from specified httpd.conf file (only works with -c)')
     cmd.add_argument('-j', '--processes', action='store', type=int, help='Number of processes to fork for log crunching (default: smart)', default=parallel.SMART)
     cmd.add_argument('-l', '--lines', action='store', type=int, help='Only process LINES lines of input')
+    cmd.add_argument('-w', '--window', action='store', type=int, help='Maximum number of chunks read ahead of the parsers (default: smart)', default=parallel.SMART)
+    cmd.add_argument('-m', '--mmap', action='store_true', help="mmap() the logs and send workers byte ranges instead of lines (ignored with -l)")
+    cmd.add_argument('-S', '--sort-memory', action='store', type=int, metavar='MB', help='Memory ORDER BY may use before spilling sorted runs to disk (default: %d)' % (extsort.BUDGET/1024/1024), default=extsort.BUDGET/1024/1024)
+    cmd.add_argument('-k', '--cache', action='store_true', help="Keep parsed logs in an on-disk cache and load them from there while they are unchanged")
+    cmd.add_argument('--cache-dir', action='store', help='Directory for the cache (default: %s)' % cache.DIRECTORY, default=cache.DIRECTORY)
+    cmd.add_argument('-F', '--follow', action='store_true', help="Keep reading the logs as they grow (and are rotated) and keep the -q query's result up to date")
+    cmd.add_argument('-r', '--refresh', action='store', type=float, metavar='SECONDS', help='How often to read new lines and show the result with --follow (default: 2)', default=2)
+    cmd.add_argument('-b', '--blocksize', action='store', type=int, help='Number of bytes to read from a log at a time (default: %d)' % ingest.BLOCKSIZE, default=ingest.BLOCKSIZE)
     interactive = cmd.add_mutually_exclusive_group(required=False)
     interactive.add_argument('-i', '--interactive', action='store_true', help="Use line-based interactive interface")
     interactive.add_argument('-c', '--curses', action='store_true', help=argparse.SUPPRESS)
@@ -216,6 +396,13 @@ def main():
     if args.ctype and not args.config:
         cmd.error("-T/--ctype only works with -C/--config option")
 
+    if args.follow and not args.query:
+        cmd.error("-F/--follow needs a query to keep up to date, given with -q")
+    if args.follow and (args.interactive or args.curses):
+        cmd.error("-F/--follow can't be used with -i or -c")
+    if args.follow and args.lines:
+        cmd.error("-F/--follow reads whole files and can't be used with -l/--lines")
+
     if args.config and args.ctype:
         config = args.config.read()
         args.config.close()
@@ -235,6 +422,7 @@ def main():
     parser.init()
 
     parallel.numprocs = args.processes
+    extsort.BUDGET = args.sort_memory * 1024 * 1024
 
     LoGrok(args, interactive=args.interactive, curses=args.curses)
 
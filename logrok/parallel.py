@@ -1,5 +1,12 @@
 from multiprocessing import Process, Queue, cpu_count
+from threading import Thread
 from functools import wraps
+from Queue import Empty
+from array import array
+import cPickle
+import os
+import resource
+import traceback
 
 import screen
 from util import ChunkableList
@@ -7,38 +14,160 @@ from util import ChunkableList
 DEBUG=False
 SMART=-1
 numprocs=SMART
+_pool=None
+# how long to block on a result before checking that the workers are alive
+LIVENESS_TIMEOUT=5
+
+class WorkerError(Exception): pass
+
+class Counters(object):
+    """
+    What the workers did while the counters were being kept: tasks run,
+    input rows they consumed, bytes pickled onto the queues each way (if
+    `shipped`), worker CPU seconds, the workers that took part and the
+    largest resident size, in bytes, a worker had at the end of a task.
+    """
+    def __init__(self, shipped=True):
+        self.shipped = shipped
+        self.tasks = 0
+        self.rows = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu = 0.0
+        self.rss = None
+        self.workers = set()
+
+_counters = []
+def count(shipped=True):
+    """ start keeping a new set of Counters; hand it to uncount() when done """
+    c = Counters(shipped)
+    _counters.append(c)
+    return c
+
+def uncount(c):
+    _counters.remove(c)
+
+# Workers answer every chunk with exactly one (rows_consumed, results) message
+# so the cost of a queue round-trip is paid per chunk and not per row. A
+# failed chunk is answered with (None, traceback) instead. Once a worker sees
+# ITER_STOP on its in queue it echoes ITER_STOP on its out queue, so the
+# parent knows the job is done when it has one ITER_STOP per worker.
+#
+# While Counters are counting the bytes shipped, chunks are pickled by
+# _ship() before they are queued, so the number of bytes that crossed the
+# queues is known, and a worker given a pickled chunk pickles its answer
+# the same way. Otherwise both go on the queues as they are, and are only
+# pickled once, by the queue. Answers also carry the worker's CPU time and
+# RSS for the Counters.
+#
+# The decorated functions must live at module level: the Pool sends them to
+# its workers by reference (pickled by name), and the workers call .task
 
 def map(f):
-    @wraps(f)
-    def wrapper(**kwargs):
-        inq=kwargs['inq']
-        outq=kwargs['outq']
-        del kwargs['inq']
-        del kwargs['outq']
-        for chunk in iter(inq.get, 'ITER_STOP'):
-            resp = f(chunk, **kwargs)
-            for i in resp:
-                outq.put(i)
-    return wrapper
+    def task(chunk, kwargs):
+        resp = f(chunk, **kwargs)
+        return _consumed(chunk, resp), resp
+    return _worker(f, task)
 
 def reduce(f):
+    def task(chunk, kwargs):
+        return _consumed(chunk, None), [f(chunk, **kwargs)]
+    return _worker(f, task)
+
+def _worker(f, task):
     @wraps(f)
     def wrapper(**kwargs):
         inq=kwargs['inq']
         outq=kwargs['outq']
+        dataset=kwargs.pop('dataset', None)
         del kwargs['inq']
         del kwargs['outq']
-        for chunk in iter(inq.get, 'ITER_STOP'):
-            outq.put(f(chunk, **kwargs))
+        for msg in iter(inq.get, 'ITER_STOP'):
+            outq.put(_answer(task, msg, kwargs, dataset))
+        outq.put('ITER_STOP')
+    wrapper.task = task
     return wrapper
 
+def _answer(task, msg, kwargs, dataset):
+    """ run `task` on the chunk in `msg` and return the report for the parent """
+    started = os.times()
+    measured = isinstance(msg, str)
+    seq = None
+    try:
+        chunk = _unship(msg)
+        if isinstance(chunk, Numbered):
+            seq, chunk = chunk.seq, chunk.chunk
+        if isinstance(chunk, Rows):
+            chunk = dataset.view(chunk.rows)
+        rows, resp = task(chunk, kwargs)
+    except Exception:
+        rows, resp = None, traceback.format_exc()
+    return _report(rows, resp, started, measured, seq)
+
+def _ship(msg):
+    """ a message for the workers; pickled, and its bytes counted, if anyone is counting them """
+    counting = [c for c in _counters if c.shipped]
+    if not counting:
+        return msg
+    s = cPickle.dumps(msg, cPickle.HIGHEST_PROTOCOL)
+    for c in counting:
+        c.bytes_in += len(s)
+    return s
+
+def _unship(msg):
+    # no chunk is a str, so a str is one that _ship() pickled
+    if isinstance(msg, str):
+        return cPickle.loads(msg)
+    return msg
+
+def _report(rows, resp, started, measured, seq=None):
+    """ a worker's answer to chunk number `seq`, with what the chunk cost it; pickled if `measured` """
+    finished = os.times()
+    cpu = (finished[0] - started[0]) + (finished[1] - started[1])
+    report = (rows, resp, cpu, rss(), os.getpid(), seq)
+    if measured:
+        return cPickle.dumps(report, cPickle.HIGHEST_PROTOCOL)
+    return report
+
+def _receive(report):
+    """ (rows_consumed, results, chunk number) from a worker's report, counting what it cost """
+    size = len(report) if isinstance(report, str) else 0
+    rows, resp, cpu, resident, pid, seq = _unship(report)
+    for c in _counters:
+        c.tasks += 1
+        c.rows += rows or 0
+        if c.shipped:
+            c.bytes_out += size
+        c.cpu += cpu
+        c.rss = max(c.rss, resident)
+        c.workers.add(pid)
+    return rows, resp, seq
+
+def rss():
+    """
+    this process's resident size in bytes now, not its peak, which for
+    a long-lived worker would be the peak of every query it has run;
+    None where there is no /proc
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (IOError, IndexError, ValueError):
+        return None
+
+def _consumed(chunk, resp):
+    """ number of input rows a chunk stood for; byte ranges count their output rows """
+    if isinstance(chunk, list):
+        return len(chunk)
+    return len(resp) if resp is not None else 1
+
 class Job(object):
-    def __init__(self, datalen, name):
+    def __init__(self, datalen, name, window=0, in_queue=None, out_queue=None):
         self.datalen = datalen
         self.name = name
         self.processes = []
-        self.in_queue = Queue()
-        self.out_queue = Queue()
+        self.in_queue = in_queue if in_queue is not None else Queue(window)
+        self.out_queue = out_queue if out_queue is not None else Queue()
         self.processed_rows = 0
         self.pct_complete = 0
 
@@ -46,6 +175,112 @@ class Job(object):
         del self.in_queue
         del self.out_queue
 
+class Rows(object):
+    """
+    A reference to rows of the pool's dataset: a slice, or an array of
+    row numbers. Arrays are pickled as raw bytes.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __getstate__(self):
+        if isinstance(self.rows, array):
+            return (self.rows.typecode, self.rows.tostring())
+        return self.rows
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            self.rows = array(state[0])
+            self.rows.fromstring(state[1])
+        else:
+            self.rows = state
+
+class Numbered(object):
+    """ chunk number `seq` of a stream, so its results can be put back in order """
+    def __init__(self, seq, chunk):
+        self.seq = seq
+        self.chunk = chunk
+
+class Pool(object):
+    """
+    A set of long-lived worker processes that run parallel.map/reduce
+    functions for every query of a session. The pool is forked once the
+    logs are loaded, so each worker already holds `dataset`; work on the
+    dataset, or on a view of it, is sent as Rows references instead of
+    pickled rows. If a worker dies the job fails with WorkerError and
+    the pool is forked again for the next one.
+    """
+    def __init__(self, dataset, numprocs=SMART):
+        if numprocs == SMART:
+            numprocs = cpu_count()
+        self.dataset = dataset
+        self.numprocs = numprocs
+        self.jobs = 0
+        self.processes = []
+        self._spawn()
+
+    def _spawn(self):
+        # fresh queues: a dead worker may have left the old ones half written
+        self.in_queue = Queue()
+        self.out_queue = Queue()
+        for i in xrange(0, self.numprocs):
+            proc = Process(target=_pool_worker, args=(self.dataset, self.in_queue, self.out_queue))
+            proc.daemon = True
+            proc.start()
+            self.processes.append(proc)
+
+    def run(self, func, data, name, chunksize, _print, **kwargs):
+        self.jobs += 1
+        job = Job(len(data), name, in_queue=self.in_queue, out_queue=self.out_queue)
+        if _dataset_of(data) is self.dataset:
+            chunks = _references(data, chunksize)
+        else:
+            chunks = ChunkableList(data).chunks(chunksize)
+        tasks = 0
+        for chunk in chunks:
+            self.in_queue.put((self.jobs, func, _ship(chunk), kwargs))
+            tasks += 1
+        resp = []
+        while tasks:
+            try:
+                job_id, report = _get(job, self.processes)
+            except WorkerError:
+                # the dead worker's chunks are lost; start over for the next query
+                self.stop()
+                self._spawn()
+                raise
+            if job_id != self.jobs:
+                # left behind by an interrupted query
+                continue
+            tasks -= 1
+            rows, chunk, seq = _receive(report)
+            _collect(job, rows, chunk, resp.extend, _print)
+        if DEBUG or _print:
+            screen.print_mutable("", True)
+        return resp
+
+    def stop(self):
+        for p in self.processes:
+            p.terminate()
+        del self.processes[:]
+
+def _pool_worker(dataset, inq, outq):
+    for job_id, func, msg, kwargs in iter(inq.get, 'ITER_STOP'):
+        outq.put((job_id, _answer(func.task, msg, kwargs, dataset)))
+
+def start_pool(dataset, numprocs=SMART):
+    """ Fork the session's worker pool; run() uses it from now on """
+    global _pool
+    stop_pool()
+    _pool = Pool(dataset, numprocs)
+    return _pool
+
+def stop_pool():
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+
 def run(func, data, name="<main>", chunksize=SMART, numprocs=numprocs, _wait=True, _print=False, **kwargs):
     l = len(data)
     if l < cpu_count():
@@ -53,8 +288,11 @@ def run(func, data, name="<main>", chunksize=SMART, numprocs=numprocs, _wait=Tru
     else:
         c = l/cpu_count()
     if chunksize == SMART:
-        chunksize = min(10000, c)
-        
+        chunksize = max(1, min(10000, c))
+
+    if _pool is not None and _wait:
+        return _pool.run(func, data, name, chunksize, _print, **kwargs)
+
     if numprocs == SMART:
         if l < 1000:
             c = 1
@@ -63,54 +301,135 @@ def run(func, data, name="<main>", chunksize=SMART, numprocs=numprocs, _wait=Tru
         numprocs = min(int(cpu_count()*1.5), c)
 
     job = Job(len(data), name)
+    dataset = _dataset_of(data)
+    if dataset is not None:
+        # freshly forked workers have the store too, so send references
+        kwargs['dataset'] = dataset
     _run(func, job, numprocs, _print, **kwargs)
-    _enqueue_data(data, chunksize, job)
+    _enqueue_data(data, chunksize, job, dataset is not None)
     if not _wait:
         return job
     resp = wait(job, _print)
     return resp
 
-def wait(job, _print):
+def stream(func, chunks, name="<main>", numprocs=numprocs, window=SMART, _wait=True, _print=False, collect=None, **kwargs):
+    """
+    Like run(), but `chunks` is an iterable of chunks that is consumed
+    while the workers are running. At most `window` chunks are queued
+    for the workers at any time, so the reader never gets far ahead of
+    the parsers. If `collect` is given it is called with each batch of
+    results instead of building a list of all of them. Either way the
+    results are taken in the order of their chunks, whichever worker
+    finishes first, so a store filled from a log has its rows in the
+    order they were logged.
+    """
+    if numprocs == SMART:
+        numprocs = cpu_count()
+    if window == SMART:
+        window = numprocs * 2
+
+    job = Job(None, name, window)
+    _run(func, job, numprocs, _print, **kwargs)
+    feeder = Thread(target=_enqueue_stream, args=(chunks, job))
+    feeder.daemon = True
+    feeder.start()
+    if not _wait:
+        return job
+    resp = wait(job, _print, collect)
+    return resp
+
+def wait(job, _print, collect=None):
     data = []
-    while True:
-        if _check_running(job):
-            data += _get_data(job, _print)
-        else:
-            break
-    data += _get_data(job, _print)
-    if DEBUG or _print:
-        screen.print_mutable("", True)
-    killall(job)
+    if collect is None:
+        collect = data.extend
+    running = len(job.processes)
+    # answers to numbered chunks that came back before an earlier one;
+    # no more than the chunks queued or being worked on at once
+    early = {}
+    following = 0
+    try:
+        while running:
+            msg = _get(job, job.processes)
+            if msg == 'ITER_STOP':
+                running -= 1
+                continue
+            rows, chunk, seq = _receive(msg)
+            if seq is None:
+                _collect(job, rows, chunk, collect, _print)
+                continue
+            early[seq] = (rows, chunk)
+            while following in early:
+                rows, chunk = early.pop(following)
+                following += 1
+                _collect(job, rows, chunk, collect, _print)
+    finally:
+        if DEBUG or _print:
+            screen.print_mutable("", True)
+        killall(job)
     del job
     return data
 
-def _get_data(job, _print):
-    data = []
+def _get(job, processes):
+    """
+    Block until the next message for `job` arrives. Waking up now and
+    then is only to notice workers that died without saying so: one
+    that was killed (by the OOM killer, say) never answers its chunk,
+    so waiting on the others would wait forever.
+    """
     while True:
         try:
-            chunk = job.out_queue.get_nowait()
-        except:
-            break
-        job.processed_rows +=1
-        data.append(chunk)
-    if job.processed_rows != 0:
-        pct = int((float(job.processed_rows)/job.datalen) * 100)
-        if pct != job.pct_complete:
-            job.pct_complete = pct
-            if DEBUG or _print:
-                screen.print_mutable("Processing data... %d%%" % pct)
-    return data
+            return job.out_queue.get(True, LIVENESS_TIMEOUT)
+        except Empty:
+            # workers only exit 0 after their ITER_STOP, and pool workers never do
+            dead = [p for p in processes if p.exitcode not in (None, 0)]
+            if dead:
+                raise WorkerError("%s: worker %d died (exit code %d) before finishing" % (
+                    job.name, dead[0].pid, dead[0].exitcode))
+            if not any(p.is_alive() for p in processes):
+                raise WorkerError("%s: all workers exited before finishing" % job.name)
 
-def _check_running(job):
-    for p in job.processes:
-        p.join(1)
-        if p.exitcode is None:
-            return True
-    return False
-
-def _enqueue_data(data, chunksize, job):
-    for chunk in ChunkableList(data).chunks(chunksize):
-        job.in_queue.put(chunk)
+def _collect(job, rows, chunk, collect, _print):
+    if rows is None:
+        raise WorkerError("%s failed in a worker:\n%s" % (job.name, chunk))
+    job.processed_rows += rows
+    collect(chunk)
+    _progress(job, _print)
+
+def _progress(job, _print):
+    if job.processed_rows == 0:
+        return
+    if job.datalen is None:
+        if DEBUG or _print:
+            screen.print_mutable("Processing data... %d rows" % job.processed_rows)
+        return
+    pct = int((float(job.processed_rows)/job.datalen) * 100)
+    if pct != job.pct_complete:
+        job.pct_complete = pct
+        if DEBUG or _print:
+            screen.print_mutable("Processing data... %d%%" % pct)
+
+def _dataset_of(data):
+    """ the ColumnStore that `data` is, or is a View of, if any """
+    base = getattr(data, 'store', data)
+    return base if hasattr(base, 'view') else None
+
+def _references(data, chunksize):
+    for i in xrange(0, len(data), chunksize):
+        yield Rows(data[i:i+chunksize].rows)
+
+def _enqueue_data(data, chunksize, job, references=False):
+    if references:
+        chunks = _references(data, chunksize)
+    else:
+        chunks = ChunkableList(data).chunks(chunksize)
+    for chunk in chunks:
+        job.in_queue.put(_ship(chunk))
+    for j in job.processes:
+        job.in_queue.put('ITER_STOP')
+
+def _enqueue_stream(chunks, job):
+    for seq, chunk in enumerate(chunks):
+        job.in_queue.put(_ship(Numbered(seq, chunk)))
     for j in job.processes:
         job.in_queue.put('ITER_STOP')
 
@@ -125,7 +444,10 @@ def _run(func, job, numprocs, _print, **kwargs):
         proc.start()
         job.processes.append(proc)
 
-def killall(job):
+def killall(job=None):
+    if job is None:
+        stop_pool()
+        return
     for p in job.processes:
         p.terminate()
     del job.processes[:]
@@ -0,0 +1,81 @@
+"""
+Turn a parsed Statement into a physical plan
+
+The plan says which log fields a query reads and how much of its work
+can be done while the logs are being parsed. For a one-shot query
+(-q) the WHERE clause is tested as soon as a line has matched the log
+regex, so lines that can't match are never stored, and only the fields
+the query refers to are converted and kept.
+"""
+
+import ast
+
+from parser import Statement
+import where
+
+class Plan(object):
+    """
+    `schema` is the (name, converter) pairs to parse and store,
+    `predicate` a compiled WHERE clause to apply to each parsed line
+    (or None), `where` the ast it was compiled from and `statement`
+    what is left to run on the stored rows
+    """
+    def __init__(self, statement, schema, predicate=None, where=None):
+        self.statement = statement
+        self.schema = schema
+        self.predicate = predicate
+        self.where = where
+
+    @property
+    def fields(self):
+        return [f for f, converter in self.schema]
+
+def referenced(stmt):
+    """ every name `stmt` refers to: fields, aliases and function names """
+    names = set()
+    for node in ast.walk(stmt.fields):
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.Call):
+            # the parser turns a function's field arguments into strings
+            names.update(a.s for a in node.args[1:] if isinstance(a, ast.Str))
+    if stmt.where is not None:
+        names.update(n.id for n in ast.walk(stmt.where) if isinstance(n, ast.Name))
+    names.update(stmt.groupby or [])
+    if stmt.orderby:
+        names.update(stmt.orderby[0])
+    return names
+
+def star(stmt):
+    """ True if the select list has a `*` in it """
+    return any(isinstance(n, ast.Name) and n.id == '__line__' for n in ast.walk(stmt.fields))
+
+def plan(stmt, schema, pushdown=False):
+    """
+    Plan `stmt` against logs parsed with `schema`. With `pushdown` the
+    fields are projected down to the ones `stmt` uses and the WHERE
+    clause is moved into the parser; that is only right when the
+    parsed data will be used for this statement alone.
+    """
+    if stmt.fields is None:
+        raise SyntaxError("What fields are you selecting?")
+    if not pushdown:
+        return Plan(stmt, schema)
+
+    if not star(stmt):
+        names = referenced(stmt)
+        # every row needs at least one column, even for count(*)
+        schema = [(f, c) for f, c in schema if f in names] or schema[:1]
+
+    predicate = None
+    if stmt.where is not None:
+        fields = [f for f, converter in schema]
+        try:
+            predicate = where.compile_predicate(stmt.where, fields, schema)
+        except SyntaxError:
+            # leave it to the executor, which reports it against the query
+            pass
+        else:
+            return Plan(Statement(stmt.fields, stmt.frm, None, stmt.groupby, stmt.orderby, stmt.limit),
+                schema, predicate, stmt.where)
+    return Plan(stmt, schema)
@@ -0,0 +1,192 @@
+"""
+Mergeable summaries of large columns in bounded memory
+
+Each sketch can be fed values in any order, in as many pieces as there
+are workers and chunks, and merge()d with another sketch of the same
+kind; the result is the same (or, for the randomised ones, as accurate)
+as if it had seen all of the values itself.
+"""
+
+import math
+import random
+try:
+    from collections import Counter
+except ImportError:
+    # python < 2.7 compatability
+    from compat.Counter import Counter
+
+def select(values, k):
+    """
+    The k-th smallest item of `values` (k counts from 0) in expected
+    linear time (quickselect). `values` is not modified.
+    """
+    if not 0 <= k < len(values):
+        raise IndexError("select() index out of range")
+    while True:
+        pivot = values[random.randrange(len(values))]
+        lows = [v for v in values if v < pivot]
+        if k < len(lows):
+            values = lows
+            continue
+        highs = [v for v in values if v > pivot]
+        equal = len(values) - len(lows) - len(highs)
+        if k < len(lows) + equal:
+            return pivot
+        k -= len(lows) + equal
+        values = highs
+
+class KLL(object):
+    """
+    KLL quantile sketch (Karnin, Lang, Liberty 2016). Values live in a
+    stack of compactors; an item in compactor h stands for 2**h values.
+    When the sketch is full a compactor is sorted and every other item
+    is promoted to the next one, so memory stays around 3*k items and
+    quantiles are within about 1.7/k of the true rank.
+    """
+    def __init__(self, k=200):
+        self.k = k
+        self.compactors = []
+        self.size = 0
+        self.maxsize = 0
+        self._grow()
+
+    def _grow(self):
+        self.compactors.append([])
+        self.maxsize = sum(self._capacity(h) for h in xrange(len(self.compactors)))
+
+    def _capacity(self, h):
+        depth = len(self.compactors) - h - 1
+        return int(self.k * (2.0/3) ** depth) + 1
+
+    def update(self, values):
+        self.compactors[0].extend(values)
+        self.size += len(values)
+        self._compress()
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for mine, theirs in zip(self.compactors, other.compactors):
+            mine.extend(theirs)
+        self.size += other.size
+        self._compress()
+
+    def _compress(self):
+        while self.size >= self.maxsize:
+            for h, items in enumerate(self.compactors):
+                if len(items) >= self._capacity(h):
+                    if h + 1 == len(self.compactors):
+                        self._grow()
+                    items.sort()
+                    odd = len(items) & 1
+                    promoted = items[odd + random.randint(0, 1)::2]
+                    self.compactors[h+1].extend(promoted)
+                    del items[odd:]
+                    self.size = sum(len(c) for c in self.compactors)
+                    break
+
+    def __len__(self):
+        return sum(len(c) << h for h, c in enumerate(self.compactors))
+
+    def quantile(self, q):
+        """ the value at fraction `q` (0..1) of the way through the data """
+        weighted = sorted((v, 1 << h) for h, c in enumerate(self.compactors) for v in c)
+        if not weighted:
+            return None
+        target = q * sum(w for v, w in weighted)
+        seen = 0
+        for v, w in weighted:
+            seen += w
+            if seen >= target:
+                return v
+        return weighted[-1][0]
+
+_MASK64 = (1 << 64) - 1
+
+def hash64(value):
+    """ python's hash() of `value` spread over 64 bits (murmur3 finaliser) """
+    h = hash(value) & _MASK64
+    h ^= h >> 33
+    h = (h * 0xff51afd7ed558ccd) & _MASK64
+    h ^= h >> 33
+    h = (h * 0xc4ceb9fe1a85ec53) & _MASK64
+    h ^= h >> 33
+    return h
+
+class HyperLogLog(object):
+    """
+    HyperLogLog distinct counter (Flajolet et al. 2007) with 2**p one
+    byte registers; the standard error is about 1.04/sqrt(2**p), 0.8%
+    for the default p=14. Merging takes the larger of each register.
+    """
+    def __init__(self, p=14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def update(self, values):
+        registers = self.registers
+        bits = 64 - self.p
+        low = (1 << bits) - 1
+        # each distinct value only needs hashing once
+        for v in set(values):
+            h = hash64(v)
+            j = h >> bits
+            rank = bits - (h & low).bit_length() + 1
+            if rank > registers[j]:
+                registers[j] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def __len__(self):
+        m = float(self.m)
+        alpha = 0.7213/(1 + 1.079/m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count('\x00')
+        if estimate <= 2.5 * m and zeros:
+            # small range correction: linear counting
+            estimate = m * math.log(m/zeros)
+        return int(round(estimate))
+
+class SpaceSaving(object):
+    """
+    Heavy hitters in at most `capacity` counters. Values are counted
+    exactly until there are more than `capacity` distinct ones; then
+    only the largest counts are kept and `error` grows by the largest
+    count dropped, which bounds how far any kept count can be too low
+    (the mergeable form of Space-Saving/Misra-Gries). A capacity of
+    None counts every value exactly.
+
+    Every value that was dropped occurred at most `error` times, so a
+    kept value whose count is above `error` is sure to be more common
+    than all of them; certain() tells those from the ones that only
+    may be.
+    """
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.counts = Counter()
+        self.error = 0
+
+    def update(self, values):
+        self.counts.update(values)
+        self._truncate()
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.error += other.error
+        self._truncate()
+
+    def _truncate(self):
+        if self.capacity is None or len(self.counts) <= self.capacity:
+            return
+        kept = self.counts.most_common(self.capacity + 1)
+        self.error += kept.pop()[1]
+        self.counts = Counter(dict(kept))
+
+    def most_common(self, n=None):
+        return self.counts.most_common(n)
+
+    def certain(self, count):
+        """ whether a value kept with `count` is sure to be more common than every value dropped """
+        return count > self.error
@@ -1,162 +1,533 @@
 import ast
-from itertools import groupby
+import copy
+import heapq
+import operator
+from itertools import chain, imap, izip, repeat
 import parallel
 import screen
 import util
+import store as _store
+import where as _kernels
+import aggregate as _aggregate
+import extsort as _extsort
 import time
 try:
     from collections import OrderedDict
 except ImportError:
     # python < 2.7 compatability
     from compat.OrderedDict import OrderedDict
-try:
-    from collections import Counter
-except ImportError:
-    # python < 2.7 compatability
-    from compat.Counter import Counter
 
 DEBUG = False
-__is_aggregate = False
+# rows in the first and the largest batch of a streamed query
+BATCHSIZE = 10000
+MAXBATCH = 640000
 
 def do(stmt, data):
-    global  __is_aggregate
-    __is_aggregate = False # reset
+    for name, detail, op in operators(stmt, data):
+        data = op(data)
+    return data
 
-    d = data
+def operators(stmt, data):
+    """
+    The physical plan for running `stmt` on `data`: a list of (name,
+    detail, op) in the order they run, where each op takes the output
+    of the one before it (the first one gets `data`)
+    """
+    if stmt.fields is None:
+        raise SyntaxError("What fields are you selecting?")
+    top = None
+    if stmt.limit:
+        top = stmt.limit[0] + stmt.limit[1]
+        offset = stmt.limit[0]
+    select = _Select(stmt.fields)
+    output = ', '.join(select.names)
+    if top is not None and not (stmt.groupby or select.specs or stmt.orderby):
+        # nothing needs to see all of the rows, so pull batches through
+        # the pipeline and stop as soon as the limit is reached
+        ops = [('scan', 'in batches of %d rows and up' % BATCHSIZE, _batches)]
+        if stmt.where:
+            ops.append(('filter', _filtering(stmt.where, data), lambda bs: (_where(stmt.where, b) for b in bs)))
+        ops.append(('limit', '%d, %d' % stmt.limit, lambda bs: _limit(bs, offset, top)))
+        ops.append(('project', output, lambda d: _fields(select, d)))
+        return ops
+    ops = []
     if stmt.where:
-        d = _where(stmt.where, d)
+        ops.append(('filter', _filtering(stmt.where, data), lambda d: _where(stmt.where, d)))
+    aggregates = ', '.join('%s(%s)' % (name, ', '.join(map(str, [column] + extra))) for name, column, extra in select.specs)
     if stmt.groupby:
-        groups = []
-        for k, g in groupby(_groupby(stmt.groupby, d), lambda x: x[stmt.groupby[0]]):
-            groups.append(list(g))
-        resp = []
-        for group in groups:
-            resp.append(_fields(stmt.fields, group))
-        d = _flatten(resp)
+        ops.append(('group', 'by %s; %s' % (', '.join(stmt.groupby), aggregates),
+            lambda d: _group(stmt.fields, stmt.groupby, d)))
+    elif select.specs:
+        # aggregates without group by: all of the data is one group
+        ops.append(('aggregate', aggregates, lambda d: _group(stmt.fields, [], d)))
+    elif stmt.orderby and _sortable(stmt.orderby[0], stmt.fields, data):
+        # sort row numbers on the stored columns, then build output rows
+        # in that order; with a limit only the rows that make the cut
+        keys, desc = stmt.orderby[0], stmt.orderby[1] == 'desc'
+        order = ', '.join(keys) + (' desc' if desc else '')
+        if top is not None:
+            ops.append(('sort', 'top %d by %s' % (top, order), lambda d: _topk(keys, desc, top, d)))
+            ops.append(('limit', 'skip %d' % offset, lambda d: d[offset:]))
+        else:
+            ops.append(('sort', 'by %s (external merge)' % order, lambda d: _sort(keys, desc, d)))
+        ops.append(('project', output, lambda d: _fields(select, d)))
+        return ops
     else:
-        d = _fields(stmt.fields, d)
+        ops.append(('project', output, lambda d: _fields(select, d)))
     if stmt.orderby:
-        if stmt.orderby[1] == 'desc':
-            d = list(reversed(_orderby(stmt.orderby[0], d)))
-        else:
-            d = _orderby(stmt.orderby[0], d)
+        keys, desc = stmt.orderby[0], stmt.orderby[1] == 'desc'
+        order = ', '.join(keys) + (' desc' if desc else '')
+        how = 'by %s' % order if top is None else 'top %d by %s' % (top, order)
+        ops.append(('sort', how, lambda d: _orderby(keys, d, desc=desc, limit=top)))
     if stmt.limit:
-        l = stmt.limit
-        d = d[l[0]:l[0]+l[1]]
+        ops.append(('limit', '%d, %d' % stmt.limit, lambda d: d[offset:top]))
+    return ops
+
+def _filtering(where, data):
+    """ what a filter operator does, for explain """
+    detail = _kernels.describe(where)
+    if hasattr(data, 'columns') or isinstance(data, _store.View):
+        st, rows = _columnar(data)
+        pruning = sorted(_kernels.bounds(where, _kernels.numeric(st)))
+        if pruning:
+            detail += '; skipping blocks by the zone maps of %s' % ', '.join(pruning)
+    return detail
 
-    return d
+def _batches(data):
+    """
+    `data` a slice at a time for a pipeline that may stop early. The
+    slices double in size, up to MAXBATCH rows, so a query that has
+    to read everything doesn't pay for many small batches.
+    """
+    size = BATCHSIZE
+    start = 0
+    while start < len(data):
+        yield data[start:start+size]
+        start += size
+        if size < MAXBATCH:
+            size *= 2
+
+def _limit(batches, offset, top):
+    """
+    Rows `offset` up to `top` of a stream of batches, pulling no more
+    batches than it takes to get there. Views come back as one View.
+    """
+    parts = []
+    n = 0
+    for batch in batches:
+        parts.append(batch[:top-n])
+        n += len(parts[-1])
+        if n >= top:
+            break
+    if parts and isinstance(parts[0], _store.View):
+        st = parts[0].store
+        rows = chain.from_iterable(_store.rownumbers(p.rows, len(st)) for p in parts)
+        return st.view(_kernels.selection(rows))[offset:]
+    return list(chain.from_iterable(parts))[offset:]
 
 def _where(where, data):
     """
-    Compile `where` ast into executable code and run 
-    a parallel 'filter' on the data with it
+    Compile `where` ast into a column kernel and run it over the data
+    in parallel; the result is a View of the matching rows. Data that
+    isn't columnar is filtered with a compiled row predicate instead.
     """
     if where is None:
         return
-    ast.fix_missing_locations(where)
-    return parallel.run(__where, data, "<where clause>", syntree=where)
+    if not hasattr(data, 'columns') and not isinstance(data, _store.View):
+        predicate = _kernels.compile_predicate(where)
+        if DEBUG:
+            print "where clause compiled to: %s" % predicate.source
+        return parallel.run(__where, data, "<where clause>", predicate=predicate)
+    st, rows = _columnar(data)
+    kernel = _kernels.compile_where(where, st)
+    pruned = _kernels.prune(where, st, rows)
+    if pruned is not rows:
+        data = st.view(pruned)
+        if not len(data):
+            return data
+    parts = [p for p in parallel.run(__select, data, "<where clause>", kernel=kernel) if len(p)]
+    parts.sort(key=lambda p: p[0])
+    rows = _kernels.selection()
+    for p in parts:
+        rows.extend(p)
+    return st.view(rows)
+
+@parallel.reduce
+def __select(chunk, kernel):
+    return kernel.select(chunk.store, chunk.rows)
 
 @parallel.map
-def __where(chunk, syntree):
-    code = compile(syntree, '', 'eval')
-    res = []
-    for line in chunk:
-        for k in line.keys():
-            locals()[k] = line[k]
-        if eval(code):
-            res.append(line)
-    return res
-
-def _groupby(fields, data):
-    return _orderby(fields, data, "<groupby>")
-
-def _orderby(fields, data, name="<orderby>"):
+def __where(chunk, predicate):
+    return predicate.filter(chunk)
+
+class _Select(object):
+    """
+    The select list split into the aggregate calls it makes (`specs`,
+    a list of (function name, column, extra args)) and `code`, which
+    builds an output row from a representative row of the group plus
+    the aggregate results, bound as __agg_0, __agg_1, ...
+    """
+    def __init__(self, fields):
+        self.specs = []
+        pairs = [t.elts for t in fields.body.args[0].elts]
+        self.names = [k.s for k, v in pairs]
+        self.aliases = dict((k.s, v) for k, v in pairs)
+        tree = _SelectRewriter(self.specs).visit(copy.deepcopy(fields))
+        self.code = compile(ast.fix_missing_locations(tree), '', 'eval')
+
+    def row(self, line, results):
+        env = dict(line)
+        env['__line__'] = line
+        for i, r in enumerate(results):
+            env['__agg_%d' % i] = r
+        newrow = eval(self.code, globals(), env)
+        if newrow.has_key('__line__'):
+            newrow = newrow['__line__']
+        return newrow
+
+class _SelectRewriter(ast.NodeTransformer):
+    """
+    Replace aggregate calls with the names their results will be bound
+    to and record them in `specs`; other functions get the current row
+    instead of the whole data. Without `specs` aggregates are left alone.
+    """
+    def __init__(self, specs=None):
+        self.specs = specs
+
+    def visit_Call(self, node):
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        if name in _aggregate.AGGREGATES and self.specs is None:
+            self.generic_visit(node)
+            return node
+        if name in _aggregate.AGGREGATES:
+            column = node.args[1]
+            if not isinstance(column, ast.Str):
+                raise SyntaxError("%s() needs a field name" % name)
+            extra = [_kernels._literal(a) for a in node.args[2:]]
+            # make one now so bad arguments are reported here, not by a worker
+            try:
+                _aggregate.AGGREGATES[name](*extra)
+            except (TypeError, ValueError):
+                raise SyntaxError("bad arguments to %s()" % name)
+            self.specs.append((name, column.s, extra))
+            return ast.Name('__agg_%d' % (len(self.specs)-1), ast.Load())
+        self.generic_visit(node)
+        if node.args and isinstance(node.args[0], ast.Name) and node.args[0].id == '__data__':
+            node.args[0] = ast.Name('__line__', ast.Load())
+        return node
+
+def _columnar(data):
+    """ (ColumnStore, rows) for a ColumnStore or a View of one """
+    if isinstance(data, _store.View):
+        return data.store, data.rows
+    return data, slice(0, len(data))
+
+def _group(fields, groupby, data):
+    """
+    Hash aggregation: the workers bucket their rows by the full group by
+    key and compute partial aggregates per bucket, the partials are
+    merged here, and one output row is built per group. Every aggregate
+    in the select list is computed in the same single pass.
+    """
+    select = _Select(fields)
+    st, rows = _columnar(data)
+    keys = _group_keys(select, groupby, st)
+    return _group_rows(select, keys, st, _aggregate.merge(_partials(select, keys, data)))
+
+def _partials(select, keys, data):
+    """ each worker's partial aggregates for its share of `data`, per group """
+    return parallel.run(__group, data, "<group by>", keys=keys, specs=select.specs)
+
+def _group_keys(select, groupby, st):
+    """ the group by list as ('column', name) and ('expr', ast) keys for __group """
+    keys = []
+    for name in groupby:
+        if name in st.columns:
+            keys.append(('column', name))
+        elif name in select.aliases:
+            specs = []
+            expr = _SelectRewriter(specs).visit(copy.deepcopy(select.aliases[name]))
+            if specs:
+                raise SyntaxError("Can't group by an aggregate (%s)" % name)
+            keys.append(('expr', ast.fix_missing_locations(ast.Expression(expr))))
+        else:
+            raise SyntaxError("Unknown field '%s' in group by" % name)
+    for name, column, extra in select.specs:
+        if column != '__line__' and column not in st.columns:
+            raise SyntaxError("Unknown field '%s' in %s()" % (column, name))
+    return keys
+
+def _group_rows(select, keys, st, groups):
+    """ one output row per group of merged partials, in group by key order """
+    def decode(key):
+        out = []
+        for (kind, name), k in zip(keys, key):
+            col = st.columns.get(name) if kind == 'column' else None
+            out.append(col.values[k] if isinstance(col, _store.DictColumn) else k)
+        return tuple(out)
+
+    resp = []
+    for key, (first, accs) in sorted(groups.iteritems(), key=lambda g: decode(g[0])):
+        resp.append(select.row(st.row(first), [acc.result() for acc in accs]))
+    if not keys and not resp:
+        # aggregates over no rows at all still give one row: count() is 0
+        empty = [_aggregate.AGGREGATES[name](*extra).result() for name, column, extra in select.specs]
+        resp.append(select.row(dict.fromkeys(st.fields), empty))
+    return resp
+
+class Standing(object):
+    """
+    A query kept up to date while rows are appended to `data`, a
+    ColumnStore. Grouped and aggregate queries keep their merged
+    partial aggregates and only aggregate the new rows on update().
+    Other queries with an ORDER BY or a LIMIT keep the row numbers of
+    the rows that make their result so far (at most the limit's worth)
+    and only compare the new rows with those. The rest give just the
+    new rows that they select. `whole` is True if update() gives the
+    whole result rather than what was added to it.
+    """
+    def __init__(self, stmt, data):
+        if stmt.fields is None:
+            raise SyntaxError("What fields are you selecting?")
+        self.stmt = stmt
+        self.data = data
+        self.select = _Select(stmt.fields)
+        self.grouped = bool(stmt.groupby or self.select.specs)
+        self.whole = self.grouped or bool(stmt.orderby or stmt.limit)
+        if self.grouped:
+            self.keys = _group_keys(self.select, stmt.groupby or [], data)
+        elif stmt.orderby and not _sortable(stmt.orderby[0], stmt.fields, data):
+            raise SyntaxError("Following logs, queries without group by can only order by stored fields")
+        self.groups = {}
+        self.kept = _kernels.selection()
+        self.seen = 0
+
+    def update(self):
+        """ the result brought up to date with the rows added since the last update """
+        new = self.data.view(slice(self.seen, len(self.data)))
+        self.seen = len(self.data)
+        if not self.whole:
+            return do(self.stmt, new)
+        if self.stmt.where:
+            new = _where(self.stmt.where, new)
+        if not self.grouped:
+            return self._rows(new)
+        self.groups = _aggregate.merge([self.groups] + _partials(self.select, self.keys, new))
+        d = _group_rows(self.select, self.keys, self.data, self.groups)
+        top = None
+        if self.stmt.limit:
+            top = self.stmt.limit[0] + self.stmt.limit[1]
+        if self.stmt.orderby:
+            d = _orderby(self.stmt.orderby[0], d, desc=self.stmt.orderby[1] == 'desc', limit=top)
+        if self.stmt.limit:
+            d = d[self.stmt.limit[0]:top]
+        return d
+
+    def _rows(self, new):
+        """ the result of an ungrouped ORDER BY or LIMIT query, the rows kept so far plus `new` """
+        top = None
+        if self.stmt.limit:
+            top = self.stmt.limit[0] + self.stmt.limit[1]
+        st, rows = _columnar(new)
+        rows = self.kept + _kernels.selection(_store.rownumbers(rows, len(st)))
+        if self.stmt.orderby and len(rows):
+            keys, desc = self.stmt.orderby[0], self.stmt.orderby[1] == 'desc'
+            if top is not None:
+                rows = _topk(keys, desc, top, st.view(rows)).rows
+            else:
+                rows = _sort(keys, desc, st.view(rows)).rows
+        self.kept = rows[:top]
+        d = st.view(self.kept)
+        if self.stmt.limit:
+            d = d[self.stmt.limit[0]:]
+        return _fields(self.select, d)
+
+@parallel.reduce
+def __group(chunk, keys, specs):
+    st, rows = _columnar(chunk)
+    keycols = []
+    for kind, key in keys:
+        if kind == 'column':
+            col = st.columns[key]
+            if isinstance(col, _store.DictColumn):
+                # group string columns on their dictionary codes
+                keycols.append(col.take_codes(rows))
+            else:
+                keycols.append(col.take(rows))
+        else:
+            # a list, not a generator: a generator would see the last key's code
+            code = compile(key, '', 'eval')
+            keycols.append([eval(code, globals(), {'__line__': line}) for line in chunk])
+    buckets = {}
+    for key, i in izip(izip(*keycols) if keycols else repeat(()), _store.rownumbers(rows, len(st))):
+        members = buckets.get(key)
+        if members is None:
+            members = buckets[key] = []
+        members.append(i)
+
+    partial = {}
+    for key, members in buckets.iteritems():
+        accs = []
+        for name, column, extra in specs:
+            acc = _aggregate.AGGREGATES[name](*extra)
+            acc.update(_group_values(st, column, members, acc.numeric))
+            accs.append(acc)
+        partial[key] = [members[0], accs]
+    return partial
+
+def _group_values(st, column, members, numeric):
+    if column == '__line__':
+        return members
+    col = st.columns[column]
+    values = list(col.take(members))
+    if numeric and isinstance(col, _store.DictColumn):
+        values = [int(v) for v in values]
+    return values
+
+def _orderby(fields, data, name="<orderby>", desc=False, limit=None):
+    """
+    Sort output rows on all of `fields`; with a `limit` only that many
+    rows are kept, in a bounded heap, instead of sorting everything.
+    """
     if DEBUG:
         print "starting sort for %s on %d lines" % (name, len(data))
     s = time.time()
-    f = fields[0]
-    newdata = sorted(data, key=lambda x: x[f])
+    key = lambda x: tuple(x[f] for f in fields)
+    if limit is None:
+        newdata = sorted(data, key=key, reverse=desc)
+    elif desc:
+        newdata = heapq.nlargest(limit, data, key=key)
+    else:
+        newdata = heapq.nsmallest(limit, data, key=key)
     if DEBUG:
         print "sort for %s ran in %0.3f seconds" % (name, time.time() - s)
     return newdata
 
-def _fields(fields, __data__):
+def _sortable(keys, fields, data):
     """
-    Compile fields ast into executable code and run 
-    a parallel 'filter' on the data with it
+    True if every ORDER BY key is a column of `data`, a ColumnStore or
+    a View of one, that the select list doesn't rename to something else
     """
-    if fields is None:
-        raise SyntaxError("What fields are you selecting?")
-    ast.fix_missing_locations(fields)
-    code = compile(fields, '', 'eval')
-    resp = []
-    for __line__ in __data__:
-        for k in __line__.keys():
-            locals()[k] = __line__[k]
-        newrow = eval(code)
-        if newrow.has_key('__line__'):
-            newrow = newrow['__line__']
-        resp.append(newrow)
-        if __is_aggregate:
-            break
-    return resp
+    if not hasattr(data, 'columns') and not isinstance(data, _store.View):
+        return False
+    st, rows = _columnar(data)
+    aliases = _Select(fields).aliases
+    for k in keys:
+        if k not in st.columns:
+            return False
+        if k in aliases and not (isinstance(aliases[k], ast.Name) and aliases[k].id == k):
+            return False
+    return True
 
-def _flatten(l):
-    r = []
-    for i in l:
-        r += i
-    return r
+def _topk(keys, desc, n, data):
+    """
+    The first `n` rows of `data` in ORDER BY `keys` order, as a View.
+    Each worker keeps its own top `n` in a bounded heap and only those
+    are merged here. Ties are broken by row number, which is the order
+    the rows were logged in: parallel.stream() hands the parsers'
+    chunks over in order.
+    """
+    st, rows = _columnar(data)
+    parts = parallel.run(__topk, data, "<order by>", keys=keys, desc=desc, n=n)
+    if desc:
+        best = [-i for key, i in heapq.nlargest(n, chain(*parts))]
+    else:
+        best = [i for key, i in heapq.nsmallest(n, chain(*parts))]
+    return st.view(_kernels.selection(best))
+
+def _sort(keys, desc, data):
+    """
+    All of `data` in ORDER BY `keys` order, as a View. Workers sort
+    runs of rows in parallel, spilling them to disk if the whole sort
+    would not fit in extsort.BUDGET, and the runs are merged lazily.
+    Ties keep the order the rows were logged in, as in _topk().
+    """
+    st, rows = _columnar(data)
+    spill = _extsort.must_spill(len(data))
+    chunksize = _extsort.run_length(len(data), parallel.numprocs)
+    runs = parallel.run(__sortrun, data, "<order by>", chunksize=chunksize, keys=keys, desc=desc, spill=spill)
+    entries = _extsort.merge(runs, desc)
+    if desc:
+        return st.view(_kernels.selection(-i for key, i in entries))
+    return st.view(_kernels.selection(i for key, i in entries))
+
+@parallel.reduce
+def __sortrun(chunk, keys, desc, spill):
+    st, rows = _columnar(chunk)
+    values = izip(*[st.columns[k].take(rows) for k in keys])
+    nums = _store.rownumbers(rows, len(st))
+    if desc:
+        run = sorted(izip(values, imap(operator.neg, nums)), reverse=True)
+    else:
+        run = sorted(izip(values, nums))
+    if spill:
+        return _extsort.spill(run)
+    return run
+
+@parallel.reduce
+def __topk(chunk, keys, desc, n):
+    st, rows = _columnar(chunk)
+    values = izip(*[st.columns[k].take(rows) for k in keys])
+    nums = _store.rownumbers(rows, len(st))
+    if desc:
+        # negated row numbers, so that ties still favour earlier rows
+        return heapq.nlargest(n, izip(values, imap(operator.neg, nums)))
+    return heapq.nsmallest(n, izip(values, nums))
+
+def _fields(select, data):
+    """
+    The output rows for `data`, a query's select list applied to each
+    row; the select list must not aggregate (see _group() for that)
+    """
+    return [select.row(line, ()) for line in data]
+
+def _aggregate_over(data, name, column, *extra):
+    """ a single aggregate over all of `data`, in one parallel pass """
+    partials = parallel.run(__group, data, '%s()' % name, keys=[], specs=[(name, column, list(extra))])
+    groups = _aggregate.merge(partials)
+    if not groups:
+        return None
+    first, accs = groups[()]
+    return accs[0].result()
+
+# Aggregate functions. In a query these are computed by _group(); calling
+# them directly runs the same accumulator over the data.
 
 def count(data, i):
-    global __is_aggregate
-    __is_aggregate = True
     return len(data)
 
 def avg(data, column):
-    global __is_aggregate
-    __is_aggregate = True
-    vals = [row[column] for row in data]
-    data = parallel.run(parallel.map(
-        lambda chunk: [(sum([int(line) for line in chunk]), len(chunk))]), 
-        vals,
-        'avg()'
-    )
-    dividend = parallel.run(parallel.reduce(lambda data: sum([d[0] for d in data], 0.0)), data)
-    divisor  = parallel.run(parallel.reduce(lambda data: sum([d[1] for d in data])), data)
-    return sum(dividend)/sum(divisor)
+    return _aggregate_over(data, 'avg', column)
 
 def mean(data, column):
     return avg(data, column)
 
 def median(data, column):
-    global __is_aggregate
-    __is_aggregate = True
-    d = sorted(data, key=lambda x: x[column])
-    if len(d) & 0x01:
-        return data[(len(d)-1)/2]
-    m = len(d)/2
-    a, b = data[m-1:m+1]
-    return (a[column]+b[column]/2)
-
-def mode(data, column, ind=0):
-    global __is_aggregate
-    __is_aggregate = True
-    ind = int(ind)
-    return Counter([x[column] for x in data]).most_common(ind+1)[ind][0]
+    return _aggregate_over(data, 'median', column)
+
+def percentile(data, column, p):
+    return _aggregate_over(data, 'percentile', column, p)
+
+def p95(data, column):
+    return _aggregate_over(data, 'p95', column)
+
+def p99(data, column):
+    return _aggregate_over(data, 'p99', column)
+
+def mode(data, column, ind=0, exact=None):
+    return _aggregate_over(data, 'mode', column, ind, exact)
+
+def top(data, column, k=10):
+    return _aggregate_over(data, 'top', column, k)
+
+def count_distinct(data, column):
+    return _aggregate_over(data, 'count_distinct', column)
 
 def max(data, column):
-    global __is_aggregate
-    __is_aggregate = True
-    max = __builtins__['max']
-    vals = [row[column] for row in data]
-    return max(parallel.run(parallel.reduce(lambda chunk: max([int(i) for i in chunk])), vals))
+    return _aggregate_over(data, 'max', column)
 
 def min(data, column):
-    global __is_aggregate
-    __is_aggregate = True
-    min = __builtins__['min']
-    vals = [row[column] for row in data]
-    return min(parallel.run(parallel.reduce(lambda chunk: min([int(i) for i in chunk])), vals))
+    return _aggregate_over(data, 'min', column)
 
 def div(data, a, b):
     try:
@@ -167,44 +538,29 @@ def div(data, a, b):
         b = float(b)
     return a/b
 
-def year(data, d):
+def _datepart(data, d, unit, base):
+    """
+    part of a YYYYMMDDhhmmss time, the value of field `d` or `d`
+    itself, found by arithmetic rather than by slicing its digits
+    """
     if type(d) == str:
         d = data[d]
-    else:
-        d = str(d)
-    return int(d[:4])
+    return int(d) // unit % base
+
+def year(data, d):
+    return _datepart(data, d, 10000000000, 10000)
 
 def month(data, d):
-    if type(d) == str:
-        d = data[d]
-    else:
-        d = str(d)
-    return int(d[4:6])
+    return _datepart(data, d, 100000000, 100)
 
 def day(data, d):
-    if type(d) == str:
-        d = data[d]
-    else:
-        d = str(d)
-    return int(d[6:8])
+    return _datepart(data, d, 1000000, 100)
 
 def hour(data, d):
-    if type(d) == str:
-        d = data[d]
-    else:
-        d = str(d)
-    return int(d[8:10])
+    return _datepart(data, d, 10000, 100)
 
 def minute(data, d):
-    if type(d) == str:
-        d = data[d]
-    else:
-        d = str(d)
-    return int(d[10:12])
+    return _datepart(data, d, 100, 100)
 
 def second(data, d):
-    if type(d) == str:
-        d = data[d]
-    else:
-        d = str(d)
-    return int(d[12:14])
+    return _datepart(data, d, 1, 100)
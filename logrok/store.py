@@ -0,0 +1,315 @@
+"""Column oriented, in-memory storage for parsed log data"""
+
+from array import array
+from itertools import imap, izip
+
+# rows per block of a zone map
+ZONE = 8192
+
+class ZoneMap(object):
+    """
+    The smallest and largest value of each block of (at most ZONE)
+    rows of an IntColumn. Blocks start at the row numbers in `starts`;
+    the first `covered` rows of the column have been mapped.
+    """
+    def __init__(self):
+        self.starts = array('l')
+        self.mins = array('l')
+        self.maxs = array('l')
+        self.covered = 0
+
+    def __len__(self):
+        return len(self.starts)
+
+    def update(self, values):
+        """ map the rows of `values`, the column's array, added since the last update """
+        for i in xrange(self.covered, len(values), ZONE):
+            block = values[i:i+ZONE]
+            self.starts.append(i)
+            self.mins.append(min(block))
+            self.maxs.append(max(block))
+        self.covered = len(values)
+
+    def merge(self, other):
+        """ append the blocks of `other`, which maps the rows that follow ours """
+        offset = self.covered
+        self.starts.extend(array('l', [start + offset for start in other.starts]))
+        self.mins.extend(other.mins)
+        self.maxs.extend(other.maxs)
+        self.covered += other.covered
+
+    def __getstate__(self):
+        return self.covered, self.starts.tostring(), self.mins.tostring(), self.maxs.tostring()
+
+    def __setstate__(self, state):
+        self.covered = state[0]
+        self.starts, self.mins, self.maxs = array('l'), array('l'), array('l')
+        for a, s in zip((self.starts, self.mins, self.maxs), state[1:]):
+            a.fromstring(s)
+
+    def ranges(self, lo=None, hi=None):
+        """ (start, stop) of the blocks that may hold values from `lo` to `hi` """
+        stops = list(self.starts[1:]) + [self.covered]
+        return [(start, stop) for start, stop, low, high in izip(self.starts, stops, self.mins, self.maxs)
+            if (lo is None or high >= lo) and (hi is None or low <= hi)]
+
+def intersect(a, b):
+    """ the rows in both `a` and `b`, sorted lists of (start, stop) ranges """
+    out = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start, stop = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+        if start < stop:
+            out.append((start, stop))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return out
+
+def coalesce(ranges):
+    """ sorted (start, stop) ranges with the adjacent ones joined up """
+    out = []
+    for start, stop in ranges:
+        if out and out[-1][1] == start:
+            out[-1] = (out[-1][0], stop)
+        else:
+            out.append((start, stop))
+    return out
+
+class IntColumn(object):
+    """
+    integer values packed into a typed array, with a zone map of them
+    that is brought up to date by zonemap()
+    """
+    def __init__(self):
+        self.values = array('l')
+        self.zones = ZoneMap()
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, value):
+        self.values.append(value)
+
+    def extend(self, values):
+        self.values.extend(values)
+
+    def merge(self, other):
+        self.zonemap().merge(other.zonemap())
+        self.values.extend(other.values)
+
+    def zonemap(self):
+        self.zones.update(self.values)
+        return self.zones
+
+    # arrays pickle as lists of python ints; ship the raw bytes instead.
+    # A parser worker pickles the store it filled, so that is where the
+    # zone map of each chunk gets built.
+    def __getstate__(self):
+        return self.values.tostring(), self.zonemap()
+
+    def __setstate__(self, state):
+        values, self.zones = state
+        self.values = array('l')
+        self.values.fromstring(values)
+
+    def take(self, rows):
+        """ values for `rows`, which is a slice or a sequence of row numbers """
+        if isinstance(rows, slice):
+            return iter(self.values[rows])
+        return imap(self.values.__getitem__, rows)
+
+class _Index(dict):
+    """ {value: code} that gives a value it hasn't seen the next code """
+    def __init__(self, values):
+        dict.__init__(self, ((v, i) for i, v in enumerate(values)))
+        self.values = values
+
+    def __missing__(self, value):
+        code = self[value] = len(self.values)
+        self.values.append(value)
+        return code
+
+class DictColumn(object):
+    """
+    Dictionary-encoded strings: every distinct value is stored once in
+    `values` and each row holds a small integer code into it.
+    """
+    def __init__(self):
+        self.codes = array('i')
+        self.values = []
+        self.index = _Index(self.values)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def append(self, value):
+        self.codes.append(self.index[value])
+
+    def extend(self, values):
+        # only values new to the dictionary cost a python call
+        self.codes.extend(imap(self.index.__getitem__, values))
+
+    def encode(self, value):
+        """ the code for `value`, adding it to the dictionary if it is new """
+        return self.index[value]
+
+    def reindex(self):
+        """ rebuild the index after `values` has been replaced """
+        self.index = _Index(self.values)
+
+    def merge(self, other):
+        """
+        Append the rows of `other`, which has its own dictionary, by
+        translating its codes into ours; each distinct value is only
+        looked up once per merge.
+        """
+        mapping = array('i', imap(self.index.__getitem__, other.values))
+        self.codes.extend(array('i', imap(mapping.__getitem__, other.codes)))
+
+    def __getstate__(self):
+        return self.codes.tostring(), self.values
+
+    def __setstate__(self, state):
+        codes, self.values = state
+        self.codes = array('i')
+        self.codes.fromstring(codes)
+        self.reindex()
+
+    def take(self, rows):
+        return imap(self.values.__getitem__, self.take_codes(rows))
+
+    def take_codes(self, rows):
+        """ the codes, rather than the values, for `rows` """
+        if isinstance(rows, slice):
+            return self.codes[rows]
+        return imap(self.codes.__getitem__, rows)
+
+def rownumbers(rows, length):
+    """ `rows`, a slice or a sequence of row numbers, as a sequence of row numbers """
+    if isinstance(rows, slice):
+        return xrange(*rows.indices(length))
+    return rows
+
+def column_for(converter):
+    """ strings are dictionary-encoded, every other converter yields an int """
+    if converter is str:
+        return DictColumn()
+    return IntColumn()
+
+class View(object):
+    """
+    The rows of a ColumnStore picked out by a slice or by a sequence
+    of row numbers. Rows are only turned into dicts when iterated.
+    """
+    def __init__(self, store, rows):
+        self.store = store
+        self.rows = rows
+
+    def __len__(self):
+        if isinstance(self.rows, slice):
+            return len(xrange(*self.rows.indices(len(self.store))))
+        return len(self.rows)
+
+    def __iter__(self):
+        fields = self.store.fields
+        cols = [self.column(f) for f in fields]
+        for values in izip(*cols):
+            yield dict(izip(fields, values))
+
+    def __getitem__(self, i):
+        if not isinstance(self.rows, slice):
+            if isinstance(i, slice):
+                return View(self.store, self.rows[i])
+            return self.store.row(self.rows[i])
+        start, stop, step = self.rows.indices(len(self.store))
+        if isinstance(i, slice):
+            a, b, c = i.indices(len(self))
+            return View(self.store, slice(start + a*step, start + b*step, step*c))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("View index out of range")
+        return self.store.row(start + i*step)
+
+    @property
+    def fields(self):
+        return self.store.fields
+
+    def column(self, name):
+        return self.store.columns[name].take(self.rows)
+
+class ColumnStore(object):
+    """
+    Parsed log rows kept as one typed column per field instead of one
+    dict per line. Rows are added as tuples in `fields` order and read
+    back as dicts, as Views, or a column at a time.
+
+    Parser workers each fill a small ColumnStore per chunk, so strings
+    are dictionary-encoded before they are pickled, and the main
+    process merge()s those into the session's store. `skipped` counts
+    the lines that were read but couldn't be parsed into rows.
+    """
+    def __init__(self, fields):
+        """ `fields` is a list of (name, converter) pairs """
+        self.fields = [f for f, converter in fields]
+        self.columns = dict((f, column_for(converter)) for f, converter in fields)
+        self.length = 0
+        self.skipped = 0
+        self._bind()
+
+    def _bind(self):
+        self._appenders = [self.columns[f].append for f in self.fields]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_appenders']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bind()
+
+    def __len__(self):
+        return self.length
+
+    def append(self, row):
+        for append, value in izip(self._appenders, row):
+            append(value)
+        self.length += 1
+
+    def extend(self, rows):
+        """ append `rows`, a list of tuples, a column at a time """
+        if not rows:
+            return
+        for f, values in izip(self.fields, izip(*rows)):
+            self.columns[f].extend(values)
+        self.length += len(rows)
+
+    def merge(self, other):
+        """ append all rows of `other`, a ColumnStore with the same fields """
+        for f in self.fields:
+            self.columns[f].merge(other.columns[f])
+        self.length += other.length
+        self.skipped += other.skipped
+
+    def row(self, i):
+        if i < 0:
+            i += self.length
+        return dict((f, self.columns[f].take((i,)).next()) for f in self.fields)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return View(self, i)
+        return self.row(i)
+
+    def view(self, rows):
+        """ the rows in `rows`, a slice or a sequence of row numbers """
+        return View(self, rows)
+
+    def __iter__(self):
+        return iter(View(self, slice(0, self.length)))
+
+    def column(self, name):
+        return self.columns[name].take(slice(0, self.length))
@@ -0,0 +1,246 @@
+"""
+Parse the timestamps of log lines
+
+A strftime format (apache's %{format}t) is compiled once into a
+Timestamp, which knows the regex that finds it in a log line and turns
+the matched text into two integers: the time as it was logged, as a
+sortable YYYYMMDDhhmmss, and seconds since the epoch. If every
+directive in the format has a fixed width the fields are sliced out at
+fixed offsets, otherwise a regex of the format picks them out.
+
+Busy logs repeat a timestamp for thousands of lines, and the next one
+is usually a second later. So the last few strings seen are memoized
+in a dict, which answers the repeats without running any python, and
+a new string that only differs from the one before in its seconds is
+worked out from it by adding the difference; only the rest are
+converted from scratch.
+"""
+
+import re
+import time
+import calendar
+from collections import deque
+
+# apache's %t, without its brackets
+COMMON = '%d/%b/%Y:%H:%M:%S %z'
+
+MONTHS = {'jan':1, 'feb':2, 'mar':3, 'apr':4, 'may':5, 'jun':6,
+          'jul':7, 'aug':8, 'sep':9, 'oct':10, 'nov':11, 'dec':12}
+
+# directive: (regex, width or None if it varies, what it gives)
+DIRECTIVES = {
+    'Y': (r'\d{4}', 4, 'year'),
+    'y': (r'\d\d', 2, 'year2'),
+    'm': (r'\d\d', 2, 'month'),
+    'b': (r'[A-Za-z]{3}', 3, 'monthname'),
+    'h': (r'[A-Za-z]{3}', 3, 'monthname'),
+    'B': (r'[A-Za-z]+', None, 'monthname'),
+    # syslog pads the day of the month with a space
+    'd': (r'[ \d]\d', 2, 'day'),
+    'e': (r'[ \d]\d', 2, 'day'),
+    'H': (r'[ \d]\d', 2, 'hour'),
+    'k': (r'[ \d]\d', 2, 'hour'),
+    'I': (r'[ \d]\d', 2, 'hour12'),
+    'l': (r'[ \d]\d', 2, 'hour12'),
+    'p': (r'[AaPp][Mm]', 2, 'ampm'),
+    'M': (r'\d\d', 2, 'minute'),
+    'S': (r'\d\d', 2, 'second'),
+    'z': (r'[+-]\d{4}', 5, 'zone'),
+    'Z': (r'[A-Za-z]+', None, None),
+    'a': (r'[A-Za-z]{3}', 3, None),
+    'A': (r'[A-Za-z]+', None, None),
+    's': (r'\d+', None, 'epoch'),
+    '%': (r'%', 1, None),
+}
+
+SHORTHANDS = {
+    'T': '%H:%M:%S',
+    'R': '%H:%M',
+    'D': '%m/%d/%y',
+    'F': '%Y-%m-%d',
+    'r': '%I:%M:%S %p',
+}
+
+# apache's %{sec}t, %{msec}t and %{usec}t
+EPOCHS = {'sec': 1, 'msec': 1000, 'usec': 1000000}
+
+# distinct timestamp strings remembered per Timestamp
+CACHE = 64
+
+class _Memo(dict):
+    """
+    {string: value} for the last CACHE strings looked up, calling
+    `convert` for the others. Logs are written in time order, so the
+    string added first is also the one used longest ago.
+    """
+    def __init__(self, convert):
+        self.convert = convert
+        self.order = deque()
+
+    def __missing__(self, s):
+        value = self[s] = self.convert(s)
+        self.order.append(s)
+        if len(self.order) > CACHE:
+            del self[self.order.popleft()]
+        return value
+
+class Timestamp(object):
+    """
+    a compiled strftime format; sortable(s) is `s` as the integer
+    YYYYMMDDhhmmss, in the time zone it was logged in, and epoch(s)
+    is `s` as seconds since the epoch
+    """
+    def __init__(self, fmt):
+        # apache logs the time the request started unless told otherwise
+        for prefix in ('begin:', 'end:'):
+            if fmt.startswith(prefix):
+                fmt = fmt[len(prefix):]
+        self.format = fmt
+        self.scale = 1
+        if fmt in EPOCHS:
+            self.scale = EPOCHS[fmt]
+            fmt = '%s'
+        self.pieces = _pieces(fmt)
+        self.regex = ''.join(rx if kind is None else '(?:%s)' % rx for rx, width, kind in self.pieces)
+        self.slices = None
+        if all(width is not None for rx, width, kind in self.pieces):
+            self.slices = []
+            offset = 0
+            for rx, width, kind in self.pieces:
+                if kind is not None:
+                    self.slices.append((kind, offset, offset + width))
+                offset += width
+        else:
+            self.kinds = [kind for rx, width, kind in self.pieces if kind is not None]
+            self.match = re.compile(''.join(rx if kind is None else '(%s)' % rx
+                for rx, width, kind in self.pieces) + '$').match
+        # where the seconds are, if a change in them can be added on
+        self.seconds = None
+        if self.slices is not None and self.scale == 1:
+            seconds = [(start, stop) for kind, start, stop in self.slices if kind == 'second']
+            if len(seconds) == 1 and not any(kind == 'epoch' for kind, start, stop in self.slices):
+                self.seconds = seconds[0]
+        self.last = None
+        self.value = None
+        # the converters for log_match: a hit is just a dict lookup
+        self.sortable = _Memo(lambda s: self.lookup(s)[0]).__getitem__
+        self.epoch = _Memo(lambda s: self.lookup(s)[1]).__getitem__
+
+    def lookup(self, s):
+        """ (sortable, epoch) for `s` """
+        if s != self.last:
+            value = self._successor(s)
+            if value is None:
+                value = self.convert(s)
+            self.last, self.value = s, value
+        return self.value
+
+    def _successor(self, s):
+        """ (sortable, epoch) for `s` from the last string, if only the seconds differ """
+        if self.seconds is None or self.last is None:
+            return None
+        start, stop = self.seconds
+        last = self.last
+        if s[:start] != last[:start] or s[stop:] != last[stop:]:
+            return None
+        try:
+            second = int(s[start:stop])
+        except ValueError:
+            return None
+        if not 0 <= second < 60:
+            # a leap second; leave it to convert()
+            return None
+        delta = second - int(last[start:stop])
+        sortable, epoch = self.value
+        return sortable + delta, epoch + delta
+
+    def convert(self, s):
+        """ (sortable, epoch) for `s` """
+        if self.slices is not None:
+            fields = dict((kind, s[start:stop]) for kind, start, stop in self.slices)
+        else:
+            m = self.match(s)
+            if m is None:
+                raise ValueError("'%s' doesn't look like %s" % (s, self.format))
+            fields = dict(zip(self.kinds, m.groups()))
+        return _convert(fields, self.scale)
+
+def _pieces(fmt):
+    """ (regex, width, kind) for each directive and literal of `fmt`; literals have no kind """
+    pieces = []
+    i = 0
+    while i < len(fmt):
+        c = fmt[i]
+        if c != '%':
+            pieces.append((re.escape(c), 1, None))
+            i += 1
+            continue
+        if i + 1 == len(fmt):
+            raise SyntaxError("Time format '%s' ends with a lone %%" % fmt)
+        d = fmt[i+1]
+        i += 2
+        if d in SHORTHANDS:
+            pieces.extend(_pieces(SHORTHANDS[d]))
+        elif d in DIRECTIVES:
+            pieces.append(DIRECTIVES[d])
+        else:
+            raise SyntaxError("Unsupported directive %%%s in time format '%s'" % (d, fmt))
+    return pieces
+
+def _convert(fields, scale=1):
+    if 'epoch' in fields:
+        epoch = int(fields['epoch']) // scale
+        t = time.localtime(epoch)
+        return _sortable(t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec), epoch
+
+    if 'year' in fields:
+        year = int(fields['year'])
+    elif 'year2' in fields:
+        year = int(fields['year2'])
+        year += 2000 if year < 69 else 1900
+    else:
+        year = None
+    if 'month' in fields:
+        month = int(fields['month'])
+    elif 'monthname' in fields:
+        month = MONTHS[fields['monthname'][:3].lower()]
+    else:
+        month = 1
+    day = int(fields.get('day', 1))
+    if 'hour12' in fields:
+        hour = int(fields['hour12']) % 12
+        if fields.get('ampm', 'am').lower() == 'pm':
+            hour += 12
+    else:
+        hour = int(fields.get('hour', 0))
+    minute = int(fields.get('minute', 0))
+    second = int(fields.get('second', 0))
+
+    if year is None:
+        # syslog leaves the year out: assume this one, unless that puts
+        # the line in the future, as December's lines read in January are
+        now = time.localtime()
+        year = now.tm_year
+        if (month, day) > (now.tm_mon, now.tm_mday + 1):
+            year -= 1
+
+    t = (year, month, day, hour, minute, second)
+    if 'zone' in fields:
+        z = fields['zone']
+        offset = (int(z[1:3]) * 3600 + int(z[3:5]) * 60) * (-1 if z[0] == '-' else 1)
+        epoch = calendar.timegm(t) - offset
+    else:
+        # no zone given: it is this machine's local time
+        epoch = int(time.mktime(t + (0, 0, -1)))
+    return _sortable(*t), epoch
+
+def _sortable(year, month, day, hour, minute, second):
+    return ((((year * 100 + month) * 100 + day) * 100 + hour) * 100 + minute) * 100 + second
+
+_compiled = {}
+def compile(fmt):
+    """ the Timestamp for `fmt`, compiled once per process """
+    ts = _compiled.get(fmt)
+    if ts is None:
+        ts = _compiled[fmt] = Timestamp(fmt)
+    return ts
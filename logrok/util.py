@@ -1,5 +1,4 @@
 import re
-import itertools
 import time
 from logformat import FORMAT, Regex
 
@@ -44,6 +43,7 @@ def parse_format_string(fmt):
     condition = re.compile(r'([!,\d\\]+)')
     name = re.compile(r'\{([^\}]+)}')
     capname = None
+    arg = None
     i = 0
     while True:
         if i == flen: break
@@ -58,7 +58,7 @@ def parse_format_string(fmt):
             state = c
             i += 1
             c = fmt[i]
-            nxt = fmt[i+1]
+            nxt = fmt[i+1] if i+1 < flen else None
 
         if state != '%':
             if nxt == '%' and c not in (' ', '\t'):
@@ -70,6 +70,20 @@ def parse_format_string(fmt):
                 i += 1
                 continue
         if state == '%':
+            if c == 't' and arg is not None:
+                # %{format}t: the braces hold a strftime format, not a name
+                if sq_state is not None:
+                    output += re.escape(sq_state)
+                output += Regex.strftime(arg, name=FORMAT[c][1])
+                if sq_state is not None and nxt is not None:
+                    output += re.escape(nxt)
+                    sq_state = None
+                    i += 1
+                i += 1
+                state = None
+                capname = None
+                arg = None
+                continue
             if c in FORMAT:
                 if sq_state is not None:
                     # this value is quoted, so we'll use dstring()
@@ -85,10 +99,12 @@ def parse_format_string(fmt):
                 i += 1
                 state = None
                 capname = None
+                arg = None
                 continue
             if c == '{':
                 n = name.match(fmt[i:]).group(0)
-                capname=n[1:-1].replace('-', '_').lower()
+                arg = n[1:-1]
+                capname=arg.replace('-', '_').lower()
                 i += len(n)
                 continue
             if condition.match(c):
@@ -146,41 +162,42 @@ class Complete(object):
             return None
 
 class Table(object):
-    def __init__(self, data, start_time):
-        self.data = data
+    """
+    Print result rows, which are dicts, as a table. The rows are read
+    as they are, so there is no need to pivot them into columns first;
+    the columns are those of the rows, in the order they are first seen.
+    """
+    def __init__(self, rows, start_time):
+        self.rows = rows
         self.start = start_time
         self.size_columns()
 
     def size_columns(self):
+        self.headers = []
         self.columnsize = {}
-        self.fmt = "|"
-        for k in self.data.keys():
-            size = max([len(str(x)) for x in self.data[k]+[k]])
-            self.fmt += "%%%ds|" % size
-            self.columnsize[k] = size
+        for row in self.rows:
+            for k, v in row.iteritems():
+                size = len(str(v))
+                if k not in self.columnsize:
+                    self.headers.append(k)
+                    self.columnsize[k] = max(size, len(str(k)))
+                elif size > self.columnsize[k]:
+                    self.columnsize[k] = size
+        self.fmt = "|" + "".join("%%%ds|" % self.columnsize[k] for k in self.headers)
 
     def print_bar(self):
-        keys = tuple(self.data.keys())
+        keys = tuple(self.headers)
         width = len(self.fmt % keys)-2
         print "+%s+" % ('-'*width)
 
-    def translate(self):
-        """
-        Translate self.data from key:(row1, row2, row3), key2:(row1, row2, row3)
-        into (key, key2),(row1, row1), (row2, row2), (row3, row3)
-        """
-        return [tuple(self.data.keys())] + list(itertools.izip_longest(*self.data.values(), fillvalue='NULL'))
-
     def prnt(self):
-        outdata = self.translate()
-        headers = outdata.pop(0)
         self.print_bar()
-        print self.fmt % headers
+        print self.fmt % tuple(self.headers)
         self.print_bar()
-        for row in outdata:
-            print self.fmt % row
+        for row in self.rows:
+            print self.fmt % tuple(row.get(k, 'NULL') for k in self.headers)
         self.print_bar()
-        print "%d rows in set (%0.3f sec)" % (len(outdata), (time.time() - self.start))
+        print "%d rows in set (%0.3f sec)" % (len(self.rows), (time.time() - self.start))
 
 def reverse_partial(f, *args):
     """
@@ -194,12 +211,7 @@ def reverse_partial(f, *args):
         return f(*_a, **k)
     return wrapper
 
-
-months = { 'Jan':1,'Feb':2,'Mar':3,'Apr':4,'May':5,'Jun':6,
-        'Jul':7,'Aug':8,'Sep':9,'Oct':10,'Nov':11,'Dec':12 }
-def common_strptime(d):
-    return int("%s%s%s%s%s%s" % (d[7:11], months[d[3:6]], d[:2], d[12:14], d[15:17], d[18:20]))
-
-def strptime(fmt, datestring):
-    t = time.strptime(datestring, fmt)
-    return int("%d%d%d%d%d%d" % (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec))
+def clf_number(d):
+    if d == '-':
+        return 0
+    return int(d)
@@ -0,0 +1,310 @@
+"""
+Compile WHERE clauses into column-wise predicate kernels
+
+A kernel takes a ColumnStore and the rows to consider (a slice or an
+array of row numbers) and returns an array of the row numbers that
+match. The per-row work is done by itertools/operator loops over the
+typed columns, so nothing is evaluated by the interpreter row by row.
+
+For rows that aren't in a ColumnStore (dicts, or tuples fresh from the
+parser) compile_predicate() builds an ordinary python function instead.
+"""
+
+import ast
+import operator
+import re
+from array import array
+from itertools import chain, compress, imap, repeat
+
+import store
+
+SOURCE_OPS = {'eq':'==', 'ne':'!=', 'lt':'<', 'le':'<=', 'gt':'>', 'ge':'>='}
+
+OPS = {
+    ast.Eq: 'eq',
+    ast.NotEq: 'ne',
+    ast.Lt: 'lt',
+    ast.LtE: 'le',
+    ast.Gt: 'gt',
+    ast.GtE: 'ge',
+}
+
+# the operator to use when a comparison is written `literal op column`
+FLIPPED = {'eq':'eq', 'ne':'ne', 'lt':'gt', 'le':'ge', 'gt':'lt', 'ge':'le'}
+
+def selection(values=()):
+    return array('l', values)
+
+class Compare(object):
+    """ column <op> literal """
+    def __init__(self, column, op, value):
+        self.column = column
+        self.op = op
+        self.value = value
+
+    def select(self, data, rows):
+        col = data.columns[self.column]
+        op = getattr(operator, self.op)
+        if isinstance(col, store.DictColumn):
+            # evaluate once per distinct value, then look each row's code up
+            hits = [op(v, self.value) for v in col.values]
+            mask = imap(hits.__getitem__, col.take_codes(rows))
+        else:
+            mask = imap(op, col.take(rows), repeat(self.value))
+        return selection(compress(store.rownumbers(rows, len(data)), mask))
+
+class In(object):
+    """ column IN (literal, ...) """
+    def __init__(self, column, values):
+        self.column = column
+        self.values = frozenset(values)
+
+    def select(self, data, rows):
+        col = data.columns[self.column]
+        if isinstance(col, store.DictColumn):
+            hits = [v in self.values for v in col.values]
+            mask = imap(hits.__getitem__, col.take_codes(rows))
+        else:
+            mask = imap(self.values.__contains__, col.take(rows))
+        return selection(compress(store.rownumbers(rows, len(data)), mask))
+
+class CompareColumns(object):
+    """ column <op> column """
+    def __init__(self, left, op, right):
+        self.left = left
+        self.op = op
+        self.right = right
+
+    def select(self, data, rows):
+        op = getattr(operator, self.op)
+        mask = imap(op, data.columns[self.left].take(rows), data.columns[self.right].take(rows))
+        return selection(compress(store.rownumbers(rows, len(data)), mask))
+
+class Constant(object):
+    def __init__(self, value):
+        self.value = value
+
+    def select(self, data, rows):
+        if self.value:
+            return selection(store.rownumbers(rows, len(data)))
+        return selection()
+
+class And(object):
+    """ each term only looks at the rows that passed the terms before it """
+    def __init__(self, terms):
+        self.terms = terms
+
+    def select(self, data, rows):
+        for term in self.terms:
+            rows = term.select(data, rows)
+            if not len(rows):
+                break
+        return rows
+
+class Or(object):
+    def __init__(self, terms):
+        self.terms = terms
+
+    def select(self, data, rows):
+        matched = set()
+        for term in self.terms:
+            matched.update(term.select(data, rows))
+        return selection(sorted(matched))
+
+def compile_where(tree, data):
+    """
+    Turn the parser's WHERE ast (an ast.Expression) into a kernel for
+    the columns of `data`
+    """
+    return _compile(tree.body, data)
+
+def _compile(node, data):
+    if isinstance(node, ast.BoolOp):
+        terms = [_compile(v, data) for v in node.values]
+        if isinstance(node.op, ast.And):
+            return And(terms)
+        return Or(terms)
+    if isinstance(node, ast.Compare):
+        left, op, right = node.left, node.ops[0], node.comparators[0]
+        if isinstance(op, ast.In):
+            return In(_column(left, data), [_literal(e, data, _column(left, data)) for e in right.elts])
+        op = OPS[type(op)]
+        if isinstance(left, ast.Name) and isinstance(right, ast.Name):
+            return CompareColumns(_column(left, data), op, _column(right, data))
+        if isinstance(right, ast.Name):
+            left, right, op = right, left, FLIPPED[op]
+        if isinstance(left, ast.Name):
+            col = _column(left, data)
+            return Compare(col, op, _literal(right, data, col))
+        return Constant(getattr(operator, op)(_literal(left), _literal(right)))
+    raise SyntaxError("Can't use %s in a where clause" % type(node).__name__)
+
+def _column(node, data):
+    if not isinstance(node, ast.Name):
+        raise SyntaxError("Expected a field name in where clause")
+    if node.id not in data.columns:
+        raise SyntaxError("Unknown field '%s' in where clause" % node.id)
+    return node.id
+
+def _literal(node, data=None, column=None):
+    """ the python value of a literal, coerced to the type of `column` """
+    if isinstance(node, ast.Num):
+        value = node.n
+    elif isinstance(node, ast.Str):
+        value = node.s
+    else:
+        raise SyntaxError("Expected a value in where clause")
+    if column is None:
+        return value
+    if isinstance(data.columns[column], store.DictColumn):
+        return str(value)
+    try:
+        return int(value)
+    except ValueError:
+        raise SyntaxError("'%s' is not a number, but %s is numeric" % (value, column))
+
+def bounds(tree, numeric):
+    """
+    {column: (lo, hi)} for the columns in `numeric` that the WHERE ast
+    `tree` keeps within a range in every row it matches, from the
+    comparisons with literals that are ANDed together at its top
+    (BETWEEN is one of those). Either end may be None.
+    """
+    out = {}
+    for term in _conjuncts(tree.body):
+        if not isinstance(term, ast.Compare) or isinstance(term.ops[0], ast.In):
+            continue
+        left, op, right = term.left, OPS[type(term.ops[0])], term.comparators[0]
+        if isinstance(right, ast.Name):
+            left, right, op = right, left, FLIPPED[op]
+        if not isinstance(left, ast.Name) or left.id not in numeric or isinstance(right, ast.Name):
+            continue
+        try:
+            value = int(_literal(right))
+        except (SyntaxError, ValueError):
+            continue
+        lo, hi = out.get(left.id, (None, None))
+        if op in ('eq', 'ge', 'gt'):
+            value_lo = value + 1 if op == 'gt' else value
+            lo = value_lo if lo is None else max(lo, value_lo)
+        if op in ('eq', 'le', 'lt'):
+            value_hi = value - 1 if op == 'lt' else value
+            hi = value_hi if hi is None else min(hi, value_hi)
+        if op != 'ne':
+            out[left.id] = (lo, hi)
+    return out
+
+def _conjuncts(node):
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        for v in node.values:
+            for term in _conjuncts(v):
+                yield term
+    else:
+        yield node
+
+def numeric(data):
+    """ the columns of `data` that are integers, and so have zone maps """
+    return set(f for f, col in data.columns.iteritems() if isinstance(col, store.IntColumn))
+
+def prune(tree, data, rows):
+    """
+    `rows` (a slice or an array of row numbers of `data`) less the
+    blocks whose zone maps show they can't match the WHERE ast `tree`
+    """
+    if not isinstance(rows, slice) or rows.indices(len(data))[2] != 1:
+        # row numbers have already been picked out by something else
+        return rows
+    start, stop, step = rows.indices(len(data))
+    ranges = [(start, stop)]
+    for column, (lo, hi) in bounds(tree, numeric(data)).iteritems():
+        ranges = store.intersect(ranges, data.columns[column].zonemap().ranges(lo, hi))
+    ranges = store.coalesce(ranges)
+    if ranges == [(start, stop)]:
+        return rows
+    if len(ranges) == 1:
+        return slice(*ranges[0])
+    return selection(chain.from_iterable(xrange(a, b) for a, b in ranges))
+
+class Predicate(object):
+    """
+    A WHERE clause compiled once into `lambda row: ...`. With `fields`
+    the rows are tuples in that order and columns are read by position,
+    otherwise rows are dicts. `schema` is a list of (name, converter)
+    pairs used to give literals the type of the field they are compared
+    with. Only the source is pickled; each process compiles it once.
+    """
+    def __init__(self, tree, fields=None, schema=None):
+        self.fields = fields
+        self.types = dict(schema) if schema else {}
+        self.source = "lambda row: %s" % self._source(tree.body)
+        self._bind()
+
+    def _bind(self):
+        self.test = _compiled(self.source)
+
+    def __getstate__(self):
+        return {'fields': self.fields, 'types': {}, 'source': self.source}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bind()
+
+    def __call__(self, row):
+        return self.test(row)
+
+    def filter(self, rows):
+        return filter(self.test, rows)
+
+    def _source(self, node):
+        if isinstance(node, ast.BoolOp):
+            op = ' and ' if isinstance(node.op, ast.And) else ' or '
+            return '(%s)' % op.join(self._source(v) for v in node.values)
+        if isinstance(node, ast.Compare):
+            left, op, right = node.left, node.ops[0], node.comparators[0]
+            column = None
+            if isinstance(left, ast.Name):
+                column = left.id
+            elif isinstance(right, ast.Name):
+                column = right.id
+            if isinstance(op, ast.In):
+                values = frozenset(self._value(e, column) for e in right.elts)
+                return '(%s in %r)' % (self._operand(left, column), values)
+            return '(%s %s %s)' % (self._operand(left, column), SOURCE_OPS[OPS[type(op)]], self._operand(right, column))
+        raise SyntaxError("Can't use %s in a where clause" % type(node).__name__)
+
+    def _operand(self, node, column):
+        if not isinstance(node, ast.Name):
+            return repr(self._value(node, column))
+        if self.fields is None:
+            return 'row[%r]' % node.id
+        if node.id not in self.fields:
+            raise SyntaxError("Unknown field '%s' in where clause" % node.id)
+        return 'row[%d]' % self.fields.index(node.id)
+
+    def _value(self, node, column):
+        value = _literal(node)
+        converter = self.types.get(column)
+        if converter is None:
+            return value
+        if converter is str:
+            return str(value)
+        try:
+            return int(value)
+        except ValueError:
+            raise SyntaxError("'%s' is not a number, but %s is numeric" % (value, column))
+
+_predicates = {}
+def _compiled(source):
+    """ compile `source` once per process """
+    f = _predicates.get(source)
+    if f is None:
+        f = _predicates[source] = eval(compile(source, '<where clause>', 'eval'), {})
+    return f
+
+def compile_predicate(tree, fields=None, schema=None):
+    return Predicate(tree, fields, schema)
+
+def describe(tree):
+    """ a WHERE ast back as (roughly) the text it was parsed from """
+    source = Predicate(tree).source[len('lambda row: '):]
+    return re.sub(r"row\[('[^']*')\]", lambda m: m.group(1)[1:-1], source)
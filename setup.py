@@ -12,6 +12,7 @@ setup(
     packages=['logrok'],
     install_requires=['ply>=3.4'],
     scripts=['bin/logrok'],
+    test_suite='tests',
     classifiers=[
         'Development Status :: 4 - Beta',
         'Environment :: Console',
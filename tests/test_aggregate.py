@@ -0,0 +1,67 @@
+import random
+import unittest
+
+from logrok import aggregate
+
+def accumulate(name, args, pieces):
+    """ one accumulator per piece, merged as the workers' partials are """
+    accs = []
+    for piece in pieces:
+        acc = aggregate.AGGREGATES[name](*args)
+        acc.update(piece)
+        accs.append(acc)
+    for other in accs[1:]:
+        accs[0].merge(other)
+    return accs[0].result()
+
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(4)
+        self.values = [random.randrange(20) * random.randrange(20) for i in xrange(10001)]
+        size = len(self.values) / 6
+        self.pieces = [self.values[i:i+size] for i in xrange(0, len(self.values), size)]
+        self.pieces.append([])
+
+    def check(self, name, args=()):
+        merged = accumulate(name, args, self.pieces)
+        self.assertEqual(merged, accumulate(name, args, [self.values]), name)
+        return merged
+
+    def test_exact(self):
+        ordered = sorted(self.values)
+        self.assertEqual(self.check('count'), len(self.values))
+        self.assertAlmostEqual(self.check('avg'), float(sum(self.values)) / len(self.values))
+        self.assertEqual(self.check('min'), ordered[0])
+        self.assertEqual(self.check('max'), ordered[-1])
+        self.assertEqual(self.check('median'), ordered[len(ordered) / 2])
+        self.check('mode', (1, 'exact'))
+        self.check('top', (5,))
+        self.check('count_distinct')
+
+    def test_percentile(self):
+        ordered = sorted(self.values)
+        p = accumulate('percentile', (90,), self.pieces)
+        rank = float(sum(1 for v in ordered if v <= p)) / len(ordered)
+        self.assertAlmostEqual(rank, 0.9, delta=0.03)
+
+    def test_empty(self):
+        for name in ('avg', 'min', 'median', 'mode', 'percentile'):
+            self.assertEqual(accumulate(name, (), [[]]), None, name)
+        self.assertEqual(accumulate('count', (), [[]]), 0)
+
+    def test_bad_arguments(self):
+        self.assertRaises(SyntaxError, aggregate.Mode, 0, 'x')
+        self.assertRaises(SyntaxError, aggregate.Percentile, 101)
+
+    def test_merge_partials(self):
+        def partial(first, values):
+            acc = aggregate.Count()
+            acc.update(values)
+            return [first, [acc]]
+        groups = aggregate.merge([{'a': partial(5, [1, 2]), 'b': partial(7, [1])},
+                                  {'a': partial(3, [1])}])
+        self.assertEqual(sorted((k, first, accs[0].result()) for k, (first, accs) in groups.iteritems()),
+                         [('a', 3, 3), ('b', 7, 1)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from logrok import cache, lineparser, store
+
+FORMAT = '%h %>s %b'
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = os.path.join(self.directory, 'access.log')
+        self.parser = lineparser.LineParser(FORMAT)
+        # statuses in blocks of four rows: 200s, then 404s, then 500s
+        self.lines = ['10.0.0.%d %d %d' % (i % 3, (200, 404, 500)[i / 4], i * 10) for i in xrange(10)]
+        self.write(self.lines)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        store.ZONE = 8192
+
+    def write(self, lines, mode='w'):
+        with open(self.log, mode) as f:
+            f.write(''.join(l + '\n' for l in lines))
+
+    def parse(self):
+        data = store.ColumnStore(self.parser.schema)
+        with open(self.log) as f:
+            data.extend(filter(None, map(self.parser.compile(), f.read().splitlines())))
+        return data
+
+    def save(self):
+        before = cache.identity(self.log, FORMAT)
+        data = self.parse()
+        cache.save(self.log, FORMAT, data, before, self.directory)
+        return data
+
+    def load(self, bounds=None):
+        return cache.load(self.log, FORMAT, self.parser.schema, self.directory, bounds)
+
+    def test_round_trip(self):
+        data = self.save()
+        loaded = self.load()
+        self.assertEqual(list(loaded), list(data))
+        # the dictionaries still encode values that are new to them
+        loaded.merge(data)
+        self.assertEqual(list(loaded), list(data) * 2)
+
+    def test_missing(self):
+        self.assertEqual(self.load(), None)
+
+    def test_other_format(self):
+        self.save()
+        self.assertEqual(cache.load(self.log, '%h %>s %b ', self.parser.schema, self.directory), None)
+
+    def test_appended(self):
+        self.save()
+        self.write(['10.0.0.9 200 1'], 'a')
+        self.assertEqual(self.load(), None)
+
+    def test_appended_while_parsing(self):
+        before = cache.identity(self.log, FORMAT)
+        data = self.parse()
+        self.write(['10.0.0.9 200 1'], 'a')
+        cache.save(self.log, FORMAT, data, before, self.directory)
+        self.assertEqual(self.load(), None)
+
+    def test_bounds(self):
+        store.ZONE = 4
+        data = self.save()
+        loaded = self.load({'status_code': (404, 404)})
+        self.assertEqual(list(loaded), list(data)[4:8])
+        loaded = self.load({'status_code': (404, None), 'body_size': (None, 50)})
+        self.assertEqual(list(loaded), list(data)[4:8])
+        self.assertEqual(len(self.load({'status_code': (300, 400)})), 0)
+
+if __name__ == '__main__':
+    unittest.main()
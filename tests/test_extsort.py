@@ -0,0 +1,54 @@
+import os
+import random
+import unittest
+
+from logrok import extsort, parser, sqlfuncs, store
+
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = extsort.BLOCK, extsort.FANIN, extsort.BUDGET
+        extsort.BLOCK, extsort.FANIN = 7, 3
+        random.seed(6)
+        self.entries = [((random.randrange(50), 'x%d' % random.randrange(5)), i) for i in xrange(500)]
+
+    def tearDown(self):
+        extsort.BLOCK, extsort.FANIN, extsort.BUDGET = self.saved
+
+    def runs(self, n, reverse=False):
+        size = len(self.entries) / n + 1
+        return [sorted(self.entries[i:i+size], reverse=reverse) for i in xrange(0, len(self.entries), size)]
+
+    def test_spill_round_trip(self):
+        run = sorted(self.entries)
+        path = extsort.spill(run)
+        self.assertEqual(list(extsort.read_run(path)), run)
+        self.assertFalse(os.path.exists(path))
+
+    def test_merge(self):
+        for reverse in (False, True):
+            expected = sorted(self.entries, reverse=reverse)
+            self.assertEqual(list(extsort.merge(self.runs(4, reverse), reverse)), expected)
+            # more runs than FANIN, spilled and merged in several passes
+            spilled = [extsort.spill(run) for run in self.runs(20, reverse)]
+            self.assertEqual(list(extsort.merge(spilled, reverse)), expected)
+            self.assertFalse(any(os.path.exists(path) for path in spilled))
+
+    def test_order_by(self):
+        parser.init()
+        data = store.ColumnStore([('host', str), ('size', int)])
+        for (size, host), i in self.entries:
+            data.append((host, size))
+        rows = list(data)
+        for order, reverse in (('', False), (' desc', True)):
+            stmt = parser.parse('select * order by size, host%s' % order)
+            expected = sorted(rows, key=lambda r: (r['size'], r['host']), reverse=reverse)
+            extsort.BUDGET = extsort.BLOCK * extsort.ENTRY_BYTES * 10
+            self.assertTrue(extsort.must_spill(len(data)))
+            spilled = [dict(r) for r in sqlfuncs.do(stmt, data)]
+            extsort.BUDGET = self.saved[2]
+            in_memory = [dict(r) for r in sqlfuncs.do(stmt, data)]
+            self.assertEqual([(r['size'], r['host']) for r in spilled], [(r['size'], r['host']) for r in expected])
+            self.assertEqual(spilled, in_memory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from logrok import follow, parser, sqlfuncs, store
+
+class TailTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = os.path.join(self.directory, 'access.log')
+        self.write('a\nb\n')
+        self.tail = follow.Tail(self.log)
+
+    def tearDown(self):
+        self.tail.close()
+        shutil.rmtree(self.directory)
+
+    def write(self, s, mode='a', path=None):
+        with open(path or self.log, mode) as f:
+            f.write(s)
+
+    def lines(self):
+        return [line for chunk in self.tail.chunks(4) for line in chunk]
+
+    def test_appended(self):
+        self.assertEqual(self.lines(), ['a', 'b'])
+        self.assertEqual(self.lines(), [])
+        self.write('c\nd')
+        self.assertEqual(self.lines(), ['c'])
+        self.write('e\n')
+        self.assertEqual(self.lines(), ['de'])
+
+    def test_rotated(self):
+        self.assertEqual(self.lines(), ['a', 'b'])
+        # the old file's last line never got its newline
+        self.write('c\nd')
+        os.rename(self.log, self.log + '.1')
+        self.write('e\n', 'w')
+        self.assertEqual(self.lines(), ['c', 'd', 'e'])
+
+    def test_truncated(self):
+        self.assertEqual(self.lines(), ['a', 'b'])
+        self.write('c\n', 'w')
+        self.assertEqual(self.lines(), ['c'])
+
+class StandingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        parser.init()
+
+    def check(self, sql):
+        """ the standing query's result after each batch of rows is the query's result on all of them """
+        random.seed(7)
+        stmt = parser.parse(sql)
+        data = store.ColumnStore([('host', str), ('n', int)])
+        standing = sqlfuncs.Standing(stmt, data)
+        self.assertTrue(standing.whole)
+        for batch in xrange(6):
+            for i in xrange(random.randrange(0, 40)):
+                data.append(('10.0.0.%d' % random.randrange(5), random.randrange(100)))
+            self.assertEqual(list(standing.update()), list(sqlfuncs.do(stmt, data)), sql)
+        return standing
+
+    def test_order_by_limit(self):
+        self.check("select host, n order by n desc limit 5")
+        self.check("select * where host <> '10.0.0.1' order by n, host limit 2, 4")
+        standing = self.check("select n order by n limit 3")
+        self.assertTrue(len(standing.kept) <= 3)
+
+    def test_order_by(self):
+        self.check("select host, n where n > 50 order by host, n desc")
+
+    def test_limit(self):
+        self.check("select host, n limit 7")
+        self.check("select host limit 3, 10")
+
+    def test_grouped(self):
+        self.check("select host, count(*), max(n) group by host order by host")
+
+    def test_new_rows(self):
+        stmt = parser.parse("select n where n > 1")
+        data = store.ColumnStore([('n', int)])
+        standing = sqlfuncs.Standing(stmt, data)
+        self.assertFalse(standing.whole)
+        for values in ([1, 2], [3, 0, 4]):
+            for v in values:
+                data.append((v,))
+            self.assertEqual([row['n'] for row in standing.update()], [v for v in values if v > 1])
+
+    def test_computed_order(self):
+        data = store.ColumnStore([('n', int)])
+        self.assertRaises(SyntaxError, sqlfuncs.Standing, parser.parse("select n as m order by m limit 1"), data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import re
+import unittest
+
+from logrok import lineparser, logformat
+from logrok.util import parse_format_string
+
+LINES = {
+    'apache-common': '10.0.0.1 - bob [01/Oct/2026:10:00:00 -0400] "GET /a?b=c HTTP/1.1" 200 512',
+    'apache-common-vhost': 'example.com 10.0.0.1 - - [01/Oct/2026:10:00:01 -0400] "GET / HTTP/1.0" 304 -',
+    'ncsa-combined': '10.0.0.1 - - [31/Dec/2025:23:59:59 +0000] "POST /form HTTP/1.1" 500 17 '
+                     '"http://example.com/\\"x\\"" "Mozilla/5.0 (X11; Linux)"',
+    'referer': 'http://example.com/page -> /index.html',
+    'agent': 'curl/7.68.0',
+    'syslog': 'Oct  1 10:00:00 web1 sshd[1234]: Accepted publickey for bob',
+}
+
+def reference(fmt, line, schema):
+    """ a row the way log_match built them before formats were compiled: a group by name at a time """
+    m = re.compile(parse_format_string(fmt)).match(line)
+    if m is None:
+        return None
+    return tuple(converter(m.group(logformat.sources.get(f, f))) for f, converter in schema)
+
+class LineParserTest(unittest.TestCase):
+    def test_builtin_formats(self):
+        for name, line in LINES.iteritems():
+            fmt = logformat.TYPES[name]
+            lp = lineparser.LineParser(fmt)
+            row = lp.compile()(line)
+            self.assertNotEqual(row, None, name)
+            self.assertEqual(row, reference(fmt, line, lp.schema), name)
+
+    def test_fields(self):
+        lp = lineparser.LineParser(logformat.TYPES['apache-common'])
+        self.assertEqual(lp.fields, ['remote_host', 'logname', 'auth_user', 'date_time', 'date_time_epoch',
+                                     'request', 'status_code', 'body_size'])
+        row = dict(zip(lp.fields, lp.compile()(LINES['apache-common'])))
+        self.assertEqual(row['date_time'], 20261001100000)
+        self.assertEqual(row['date_time_epoch'], 1790863200)
+        self.assertEqual(row['status_code'], 200)
+
+    def test_projection(self):
+        fmt = logformat.TYPES['ncsa-combined']
+        lp = lineparser.LineParser(fmt)
+        schema = [(f, c) for f, c in lp.schema if f in ('status_code', 'date_time_epoch', 'request')]
+        line = LINES['ncsa-combined']
+        self.assertEqual(lp.compile(schema)(line), reference(fmt, line, schema))
+        self.assertTrue(lp.compile(schema) is lp.compile(list(schema)))
+
+    def test_rejected(self):
+        lp = lineparser.LineParser(logformat.TYPES['apache-common'])
+        parse = lp.compile()
+        self.assertEqual(parse('not a log line'), None)
+        self.assertEqual(parse(''), None)
+        # matches the regex, but there is no such month
+        self.assertEqual(parse(LINES['apache-common'].replace('Oct', 'Foo')), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import signal
+import time
+import unittest
+
+from logrok import parallel, store
+
+@parallel.reduce
+def total(chunk):
+    return sum(chunk.column('n'))
+
+@parallel.map
+def slow_first(chunk):
+    if chunk[0] == 0:
+        time.sleep(0.3)
+    return chunk
+
+@parallel.reduce
+def crash(chunk):
+    if 0 in store.rownumbers(chunk.rows, len(chunk.store)):
+        os.kill(os.getpid(), signal.SIGKILL)
+    return len(chunk)
+
+class PoolTest(unittest.TestCase):
+    def setUp(self):
+        self.timeout = parallel.LIVENESS_TIMEOUT
+        parallel.LIVENESS_TIMEOUT = 0.2
+        self.data = store.ColumnStore([('n', int)])
+        for i in xrange(100):
+            self.data.append((i,))
+        self.pool = parallel.start_pool(self.data, 3)
+
+    def tearDown(self):
+        parallel.stop_pool()
+        parallel.LIVENESS_TIMEOUT = self.timeout
+
+    def test_run(self):
+        self.assertEqual(sum(parallel.run(total, self.data, chunksize=10)), sum(xrange(100)))
+
+    def test_worker_killed(self):
+        self.assertRaises(parallel.WorkerError, parallel.run, crash, self.data, chunksize=10)
+        # the pool was forked again, and works
+        self.assertEqual(len(self.pool.processes), 3)
+        self.assertTrue(all(p.is_alive() for p in self.pool.processes))
+        self.assertEqual(sum(parallel.run(total, self.data, chunksize=10)), sum(xrange(100)))
+
+class StreamTest(unittest.TestCase):
+    def test_in_order(self):
+        chunks = [range(i, i + 10) for i in xrange(0, 200, 10)]
+        self.assertEqual(parallel.stream(slow_first, iter(chunks), numprocs=4), range(200))
+        collected = []
+        parallel.stream(slow_first, iter(chunks), numprocs=4, window=2, collect=collected.append)
+        self.assertEqual(collected, chunks)
+
+class JobTest(unittest.TestCase):
+    def setUp(self):
+        self.timeout = parallel.LIVENESS_TIMEOUT
+        parallel.LIVENESS_TIMEOUT = 0.2
+
+    def tearDown(self):
+        parallel.LIVENESS_TIMEOUT = self.timeout
+
+    def test_worker_killed(self):
+        data = store.ColumnStore([('n', int)])
+        for i in xrange(100):
+            data.append((i,))
+        self.assertRaises(parallel.WorkerError, parallel.run, crash, data, chunksize=10, numprocs=3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import random
+import unittest
+from collections import Counter
+
+from logrok import sketch
+
+def pieces(values, n):
+    """ `values` split into `n` runs, as the workers would see them """
+    size = len(values) / n + 1
+    return [values[i:i+size] for i in xrange(0, len(values), size)]
+
+class SelectTest(unittest.TestCase):
+    def test_select(self):
+        random.seed(1)
+        values = [random.randrange(50) for i in xrange(1001)]
+        ordered = sorted(values)
+        for k in (0, 1, 500, 999, 1000):
+            self.assertEqual(sketch.select(values, k), ordered[k])
+        self.assertRaises(IndexError, sketch.select, values, 1001)
+
+class KLLTest(unittest.TestCase):
+    def rank(self, ordered, v):
+        return float(sum(1 for x in ordered if x <= v)) / len(ordered)
+
+    def test_merged_quantiles(self):
+        random.seed(2)
+        values = [random.randrange(1000000) for i in xrange(100000)]
+        ordered = sorted(values)
+        merged = sketch.KLL()
+        for piece in pieces(values, 7):
+            kll = sketch.KLL()
+            kll.update(piece)
+            merged.merge(kll)
+        self.assertEqual(len(merged), len(values))
+        self.assertTrue(merged.size < merged.maxsize)
+        for q in (0.01, 0.25, 0.5, 0.95, 0.99):
+            self.assertAlmostEqual(self.rank(ordered, merged.quantile(q)), q, delta=0.03)
+
+    def test_small(self):
+        kll = sketch.KLL()
+        self.assertEqual(kll.quantile(0.5), None)
+        kll.update([3, 1, 2])
+        self.assertEqual(kll.quantile(0.5), 2)
+        self.assertEqual(kll.quantile(1), 3)
+
+class HyperLogLogTest(unittest.TestCase):
+    def test_merge_is_exact(self):
+        values = range(50000)
+        whole = sketch.HyperLogLog()
+        whole.update(values)
+        merged = sketch.HyperLogLog()
+        for piece in pieces(values, 5):
+            hll = sketch.HyperLogLog()
+            hll.update(piece)
+            merged.merge(hll)
+        self.assertEqual(merged.registers, whole.registers)
+
+    def test_estimates(self):
+        for n in (10, 1000, 200000):
+            hll = sketch.HyperLogLog()
+            hll.update(['value %d' % i for i in xrange(n)] * 2)
+            self.assertAlmostEqual(len(hll), n, delta=max(1, n * 0.03))
+
+class SpaceSavingTest(unittest.TestCase):
+    def zipf(self, n):
+        random.seed(3)
+        return [int(1 / (1 - random.random()) ** 0.8) for i in xrange(n)]
+
+    def test_exact_until_full(self):
+        values = self.zipf(20000)
+        counts = Counter(values)
+        merged = sketch.SpaceSaving(None)
+        for piece in pieces(values, 4):
+            ss = sketch.SpaceSaving(None)
+            ss.update(piece)
+            merged.merge(ss)
+        self.assertEqual(merged.counts, counts)
+        self.assertEqual(merged.error, 0)
+        self.assertTrue(all(merged.certain(c) for v, c in merged.most_common()))
+
+    def test_error_bounds(self):
+        values = self.zipf(20000)
+        counts = Counter(values)
+        merged = sketch.SpaceSaving(20)
+        for piece in pieces(values, 4):
+            ss = sketch.SpaceSaving(20)
+            ss.update(piece)
+            merged.merge(ss)
+        self.assertTrue(merged.error > 0)
+        self.assertEqual(len(merged.counts), 20)
+        for value, count in merged.counts.iteritems():
+            # kept counts are never too high, and at most `error` too low
+            self.assertTrue(count <= counts[value] <= count + merged.error)
+        for value in set(counts) - set(merged.counts):
+            self.assertTrue(counts[value] <= merged.error)
+        certain = [v for v, c in merged.most_common() if merged.certain(c)]
+        self.assertEqual(set(certain), set(v for v, c in counts.most_common(len(certain))))
+
+if __name__ == '__main__':
+    unittest.main()
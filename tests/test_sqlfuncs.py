@@ -0,0 +1,72 @@
+import unittest
+
+from logrok import lineparser, parser, sqlfuncs, store
+
+FORMAT = '%h %l %u %t "%r" %>s %b'
+
+def line(host, hour, minute, status):
+    return '%s - - [01/Oct/2026:%02d:%02d:00 -0400] "GET / HTTP/1.1" %d 100' % (host, hour, minute, status)
+
+LINES = [
+    line('10.0.0.1', 10, 0, 200),
+    line('10.0.0.1', 10, 0, 200),
+    line('10.0.0.2', 10, 1, 404),
+    line('10.0.0.1', 11, 0, 200),
+    line('10.0.0.3', 11, 1, 200),
+    line('10.0.0.2', 11, 1, 500),
+    line('10.0.0.2', 12, 0, 500),
+    line('10.0.0.2', 12, 0, 500),
+]
+
+def load(lines):
+    lp = lineparser.LineParser(FORMAT)
+    data = store.ColumnStore(lp.schema)
+    data.extend(filter(None, map(lp.compile(), lines)))
+    return data
+
+def query(sql, data):
+    return [dict(row) for row in sqlfuncs.do(parser.parse(sql), data)]
+
+class GroupByTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        parser.init()
+        cls.data = load(LINES)
+
+    def test_computed_keys(self):
+        rows = query("select hour(date_time) as hr, minute(date_time) as mn, count(*) as n "
+                     "group by hr, mn order by hr, mn", self.data)
+        self.assertEqual([(r['hr'], r['mn'], r['n']) for r in rows],
+                         [(10, 0, 2), (10, 1, 1), (11, 0, 1), (11, 1, 2), (12, 0, 2)])
+
+    def test_column_and_computed_keys(self):
+        rows = query("select remote_host, status_code, hour(date_time) as hr, count(*) as n "
+                     "group by remote_host, status_code, hr order by remote_host, hr", self.data)
+        self.assertEqual([(r['remote_host'], r['status_code'], r['hr'], r['n']) for r in rows], [
+            ('10.0.0.1', 200, 10, 2),
+            ('10.0.0.1', 200, 11, 1),
+            ('10.0.0.2', 404, 10, 1),
+            ('10.0.0.2', 500, 11, 1),
+            ('10.0.0.2', 500, 12, 2),
+            ('10.0.0.3', 200, 11, 1),
+        ])
+
+class ProjectTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        parser.init()
+        cls.data = load(LINES)
+
+    def test_fields_and_functions(self):
+        rows = query("select remote_host, hour(date_time) as hr where status_code = 500", self.data)
+        self.assertEqual([(r['remote_host'], r['hr']) for r in rows],
+                         [('10.0.0.2', 11), ('10.0.0.2', 12), ('10.0.0.2', 12)])
+
+    def test_star(self):
+        rows = query("select * limit 1, 1", self.data)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['remote_host'], rows[0]['status_code'], rows[0]['body_size']),
+                         ('10.0.0.1', 200, 100))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import calendar
+import random
+import time
+import unittest
+
+from logrok import lineparser, timestamps
+
+def sortable(t):
+    return int(time.strftime('%Y%m%d%H%M%S', t))
+
+class TimestampTest(unittest.TestCase):
+    def check_zoned(self, fmt, s, strptime_fmt, offset):
+        """ `s` in `fmt`, ending in a %z `offset` seconds from UTC, against strptime and timegm """
+        # python 2's strptime has no %z
+        t = time.strptime(s[:-6], strptime_fmt)
+        self.assertEqual(timestamps.Timestamp(fmt).convert(s), (sortable(t), calendar.timegm(t) - offset), s)
+
+    def check_local(self, fmt, s, strptime_fmt=None):
+        """ `s` in `fmt`, which has no zone, against strptime and mktime """
+        t = time.strptime(s, strptime_fmt or fmt)
+        self.assertEqual(timestamps.Timestamp(fmt).convert(s), (sortable(t), int(time.mktime(t))), s)
+
+    def test_zone(self):
+        for s, offset in (('01/Oct/2026:10:00:00 +0000', 0),
+                          ('01/Oct/2026:10:00:00 -0400', -4 * 3600),
+                          ('31/Dec/2025:23:59:59 +0530', 5 * 3600 + 30 * 60),
+                          ('29/Feb/2024:00:00:01 -1130', -(11 * 3600 + 30 * 60))):
+            self.check_zoned(timestamps.COMMON, s, '%d/%b/%Y:%H:%M:%S', offset)
+
+    def test_numeric(self):
+        for s in ('2026-10-01T10:11:12', '1999-12-31T23:59:59', '2024-02-29T00:00:00'):
+            self.check_local('%Y-%m-%dT%H:%M:%S', s)
+
+    def test_shorthands(self):
+        for fmt, longhand in (('%F %T', '%Y-%m-%d %H:%M:%S'), ('%D %R', '%m/%d/%y %H:%M'),
+                              ('%F %r', '%Y-%m-%d %I:%M:%S %p')):
+            self.assertEqual(timestamps._pieces(fmt), timestamps._pieces(longhand))
+        self.check_local('%F %T', '2026-10-01 10:11:12', '%Y-%m-%d %H:%M:%S')
+        self.check_local('%F %r', '2026-10-01 01:02:03 PM', '%Y-%m-%d %I:%M:%S %p')
+
+    def test_two_digit_years(self):
+        # the same pivot as strptime: 69-99 are 19xx, 00-68 are 20xx
+        for s in ('01/02/69 10:00', '01/02/68 10:00', '12/31/00 23:59', '12/31/99 23:59'):
+            self.check_local('%D %R', s, '%m/%d/%y %H:%M')
+
+    def test_twelve_hour(self):
+        fmt = '%Y-%m-%d %I:%M:%S %p'
+        for s in ('2026-10-01 12:00:00 AM', '2026-10-01 12:30:00 PM', '2026-10-01 01:00:00 pm',
+                  '2026-10-01 11:59:59 am', '2026-10-01 11:59:59 PM'):
+            self.check_local(fmt, s)
+
+    def test_variable_width(self):
+        fmt = '%A, %d %B %Y %H:%M:%S %Z'
+        ts = timestamps.Timestamp(fmt)
+        # %A, %B and %Z have no fixed width, so a regex picks the fields out
+        self.assertEqual(ts.slices, None)
+        for s in ('Thursday, 01 October 2026 10:11:12 UTC', 'Friday, 05 May 2023 00:00:00 GMT',
+                  'Monday, 01 January 2024 23:00:59 UTC'):
+            self.check_local(fmt, s, '%A, %d %B %Y %H:%M:%S UTC' if s.endswith('UTC') else '%A, %d %B %Y %H:%M:%S GMT')
+        self.assertRaises(ValueError, ts.convert, 'someday')
+
+    def test_syslog_year(self):
+        fmt = '%b %e %H:%M:%S'
+        ts = timestamps.Timestamp(fmt)
+        now = time.localtime()
+        year = now.tm_year
+        today = time.strftime('%b %e 00:00:00', now)
+        self.assertEqual(ts.convert(today)[0] / 10000000000, year)
+        # a day that would be more than a day from now is last year's
+        ahead = time.localtime(time.time() + 3 * 86400)
+        s = time.strftime('%b %e 12:00:00', ahead)
+        expected = year - 1 if ahead.tm_year == year else year
+        self.assertEqual(ts.convert(s)[0] / 10000000000, expected)
+        t = time.strptime('%d %s' % (expected, s), '%Y %b %d %H:%M:%S')
+        self.assertEqual(ts.convert(s), (sortable(t), int(time.mktime(t))))
+
+    def test_space_padded(self):
+        self.check_local('%b %e %k:%M:%S %Y', 'Oct  1  9:05:00 2026', '%b %d %H:%M:%S %Y')
+        self.check_local('%b %d %H:%M:%S %Y', 'Oct 12 19:05:00 2026')
+
+    def test_epochs(self):
+        t = time.localtime(1790863200)
+        for fmt, s in (('%s', '1790863200'), ('sec', '1790863200'), ('msec', '1790863200999'),
+                       ('usec', '1790863200000001'), ('end:msec', '1790863200123')):
+            self.assertEqual(timestamps.Timestamp(fmt).convert(s), (sortable(t), 1790863200), fmt)
+
+    def test_begin_end(self):
+        for fmt in ('begin:%Y-%m-%d', 'end:%Y-%m-%d'):
+            ts = timestamps.Timestamp(fmt)
+            self.assertEqual(ts.format, '%Y-%m-%d')
+            self.assertEqual(ts.convert('2026-10-01'), timestamps.Timestamp('%Y-%m-%d').convert('2026-10-01'))
+
+    def test_bad_formats(self):
+        self.assertRaises(SyntaxError, timestamps.Timestamp, '%Y-%Q')
+        self.assertRaises(SyntaxError, timestamps.Timestamp, '%Y-%')
+
+    def test_compiled_once(self):
+        self.assertTrue(timestamps.compile('%F %T') is timestamps.compile('%F %T'))
+
+class MemoTest(unittest.TestCase):
+    def sequence(self, fmt, start, n):
+        """ `n` times a second or so apart from `start`, sometimes out of order, as strings in `fmt` """
+        random.seed(8)
+        t = calendar.timegm(time.strptime(start, '%Y-%m-%d %H:%M:%S'))
+        times = []
+        for i in xrange(n):
+            t += random.choice((0, 0, 1, 1, 1, 2, 59, -1, -3))
+            times.append(time.strftime(fmt.replace('%z', '+0000'), time.gmtime(t)))
+        return times
+
+    def check(self, fmt, strings):
+        ts = timestamps.Timestamp(fmt)
+        fresh = timestamps.Timestamp(fmt)
+        for s in strings:
+            expected = fresh.convert(s)
+            self.assertEqual(ts.lookup(s), expected, s)
+            self.assertEqual((ts.sortable(s), ts.epoch(s)), expected, s)
+            self.assertTrue(len(ts.sortable.__self__) <= timestamps.CACHE)
+            self.assertTrue(len(ts.epoch.__self__) <= timestamps.CACHE)
+        return ts
+
+    def test_rollovers(self):
+        # across minutes, hours, a day and a year
+        for fmt in (timestamps.COMMON, '%Y-%m-%dT%H:%M:%S', '%b %d %H:%M:%S %Y'):
+            strings = self.sequence(fmt, '2025-12-31 22:58:00', 3000)
+            self.assertTrue(strings[-1].find('2026') != -1)
+            self.check(fmt, strings)
+
+    def test_leap_second(self):
+        self.check(timestamps.COMMON, ['31/Dec/2016:23:59:58 +0000', '31/Dec/2016:23:59:59 +0000',
+                                       '31/Dec/2016:23:59:60 +0000', '01/Jan/2017:00:00:00 +0000',
+                                       '31/Dec/2016:23:59:60 +0000', '31/Dec/2016:23:59:59 +0000'])
+
+    def test_successor(self):
+        ts = timestamps.Timestamp(timestamps.COMMON)
+        converted = []
+        convert = ts.convert
+        ts.convert = lambda s: converted.append(s) or convert(s)
+        minute = ['01/Oct/2026:10:00:%02d -0400' % i for i in (0, 1, 2, 5, 4, 59, 30)]
+        for s in minute:
+            self.assertEqual(ts.lookup(s), convert(s))
+        # only the first of a minute's times is converted from scratch
+        self.assertEqual(converted, minute[:1])
+        s = '01/Oct/2026:10:01:00 -0400'
+        self.assertEqual(ts.lookup(s), convert(s))
+        self.assertEqual(converted, [minute[0], s])
+
+    def test_no_successor(self):
+        # epochs and variable width formats are always converted
+        for fmt, strings in (('msec', ['1790863200999', '1790863201000', '1790863199999']),
+                             ('%d %B %Y %H:%M:%S', ['01 October 2026 10:00:00', '01 October 2026 10:00:01'])):
+            self.assertEqual(timestamps.Timestamp(fmt).seconds, None)
+            self.check(fmt, strings)
+
+    def test_eviction(self):
+        ts = self.check('%Y-%m-%dT%H:%M:%S', self.sequence('%Y-%m-%dT%H:%M:%S', '2026-10-01 00:00:00', 500))
+        memo = ts.sortable.__self__
+        self.assertEqual(len(memo), timestamps.CACHE)
+        self.assertEqual(len(memo.order), timestamps.CACHE)
+        self.assertEqual(set(memo), set(memo.order))
+
+class FormatStringTest(unittest.TestCase):
+    def parse(self, fmt, line):
+        lp = lineparser.LineParser(fmt)
+        row = lp.compile()(line)
+        self.assertNotEqual(row, None, fmt)
+        return dict(zip(lp.fields, row))
+
+    def test_apache_time(self):
+        row = self.parse('%h %t', '10.0.0.1 [01/Oct/2026:10:00:00 -0400]')
+        self.assertEqual((row['date_time'], row['date_time_epoch']), (20261001100000, 1790863200))
+
+    def test_custom_time(self):
+        row = self.parse('%h [%{%Y-%m-%d %H:%M:%S %z}t] %>s', '10.0.0.1 [2026-10-01 10:00:00 -0400] 200')
+        self.assertEqual((row['date_time'], row['date_time_epoch'], row['status_code']),
+                         (20261001100000, 1790863200, 200))
+        row = self.parse('%{begin:%d/%b/%Y:%H:%M:%S %z}t %h', '01/Oct/2026:10:00:00 -0400 10.0.0.1')
+        self.assertEqual((row['date_time_epoch'], row['remote_host']), (1790863200, '10.0.0.1'))
+
+    def test_epoch_time(self):
+        row = self.parse('%h %{msec}t %>s', '10.0.0.1 1790863200123 200')
+        self.assertEqual((row['date_time_epoch'], row['status_code']), (1790863200, 200))
+
+    def test_time_at_end(self):
+        row = self.parse('%h %{%H:%M:%S}t', '10.0.0.1 10:11:12')
+        self.assertEqual(row['date_time'] % 1000000, 101112)
+
+if __name__ == '__main__':
+    unittest.main()
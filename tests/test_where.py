@@ -0,0 +1,87 @@
+import random
+import unittest
+
+from logrok import lineparser, parser, store, where
+
+FORMAT = '%h %>s %b %D'
+
+# (where clause, the same test in python)
+CLAUSES = [
+    ("status_code = 404", "status_code == 404"),
+    ("status_code <> 200", "status_code != 200"),
+    ("body_size < 300", "body_size < 300"),
+    ("300 <= body_size", "300 <= body_size"),
+    ("response_time_us > body_size", "response_time_us > body_size"),
+    ("remote_host = '10.0.0.3'", "remote_host == '10.0.0.3'"),
+    ("remote_host >= '10.0.0.5'", "remote_host >= '10.0.0.5'"),
+    ("status_code in (404, 500)", "status_code in (404, 500)"),
+    ("remote_host in ('10.0.0.1', '10.0.0.2', 'nobody')", "remote_host in ('10.0.0.1', '10.0.0.2')"),
+    ("status_code = '500'", "status_code == 500"),
+    ("body_size between 100 and 200", "100 <= body_size <= 200"),
+    ("status_code = 200 and body_size > 500 and remote_host <> '10.0.0.0'",
+     "status_code == 200 and body_size > 500 and remote_host != '10.0.0.0'"),
+    ("status_code = 500 or body_size < 10 or remote_host = '10.0.0.9'",
+     "status_code == 500 or body_size < 10 or remote_host == '10.0.0.9'"),
+    ("(status_code = 404 or status_code = 500) and body_size >= 900",
+     "(status_code == 404 or status_code == 500) and body_size >= 900"),
+    ("1 = 1", "True"),
+    ("1 = 2", "False"),
+]
+
+class WhereTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        parser.init()
+        random.seed(5)
+        lp = lineparser.LineParser(FORMAT)
+        cls.schema = lp.schema
+        cls.data = store.ColumnStore(lp.schema)
+        # sorted on body_size, so its zone maps can rule blocks out
+        for size in sorted(random.randrange(1000) for i in xrange(2000)):
+            cls.data.append(lp.compile()('10.0.0.%d %d %d %d' % (
+                random.randrange(10), random.choice((200, 200, 404, 500)), size, random.randrange(1000))))
+        cls.rows = list(cls.data)
+
+    def tearDown(self):
+        store.ZONE = 8192
+
+    def tree(self, clause):
+        return parser.parse('select * where %s' % clause).where
+
+    def expected(self, test, rows):
+        return [i for i in rows if eval(test, {}, dict(self.rows[i]))]
+
+    def test_kernels(self):
+        everything = slice(0, len(self.data))
+        some = where.selection(xrange(0, len(self.data), 3))
+        for clause, test in CLAUSES:
+            kernel = where.compile_where(self.tree(clause), self.data)
+            self.assertEqual(list(kernel.select(self.data, everything)),
+                             self.expected(test, xrange(len(self.data))), clause)
+            self.assertEqual(list(kernel.select(self.data, some)), self.expected(test, some), clause)
+
+    def test_predicates(self):
+        fields = [f for f, converter in self.schema]
+        tuples = [tuple(row[f] for f in fields) for row in self.rows]
+        for clause, test in CLAUSES:
+            expected = self.expected(test, xrange(len(self.rows)))
+            predicate = where.compile_predicate(self.tree(clause), fields, self.schema)
+            self.assertEqual([i for i, row in enumerate(tuples) if predicate(row)], expected, clause)
+            predicate = where.compile_predicate(self.tree(clause), schema=self.schema)
+            self.assertEqual([i for i, row in enumerate(self.rows) if predicate(row)], expected, clause)
+
+    def test_prune(self):
+        store.ZONE = 100
+        st = store.ColumnStore(self.schema)
+        st.merge(self.data)
+        everything = slice(0, len(st))
+        for clause, test in CLAUSES:
+            tree = self.tree(clause)
+            rows = where.prune(tree, st, everything)
+            kernel = where.compile_where(tree, st)
+            self.assertEqual(list(kernel.select(st, rows)), self.expected(test, xrange(len(st))), clause)
+        rows = where.prune(self.tree('body_size between 100 and 200'), st, everything)
+        self.assertTrue(isinstance(rows, slice) and rows.stop - rows.start < len(st) / 2)
+
+if __name__ == '__main__':
+    unittest.main()